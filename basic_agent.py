@@ -21,13 +21,37 @@ along with this program; if not, see <http://www.gnu.org/licenses/>.
 
 import zombies
 import minimax
+import mcts
+import book
 
 class Agent: #(Agent, minimax.Game):
     """This is the skeleton of an agent to play the Zombies game."""
 
-    def __init__(self, name="Basic Agent"):
+    def __init__(self, name="Basic Agent", workers=None, engine="minimax",
+                 book_path=None):
         self.name = name
         self.player = zombies.PLAYER1
+        self.table = minimax.TranspositionTable()
+        self.max_depth = 2
+        self.ordering = minimax.MoveOrdering()
+        self.parallel = None
+        if workers is not None:
+            self.parallel = minimax.ParallelSearch(workers)
+        self.mcts = None
+        self.iterations = 1000
+        if engine == "mcts":
+            self.mcts = mcts.MCTS(self, inplace=True)
+        self.book = book.open_book(book_path)
+
+    """The search caches and the worker pool stay in this process when
+    the agent is pickled to be sent to the workers of a parallel search:
+    the copy is only used as the game of the search.
+    """
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["table"] = state["ordering"] = state["parallel"] = None
+        state["mcts"] = state["book"] = None
+        return state
 
     """The successors function must return (or yield) a list of
     pairs (a, s) in which a is the action played to reach the
@@ -38,16 +62,54 @@ class Agent: #(Agent, minimax.Game):
     """
     def successors(self, state):
         b, p, st = state
-        for a in b.get_actions(p, st):
+        for a in b.iter_actions(p, st):
             newboard = b.clone()
-            newboard.play_action(a, p, st)
+            newboard.apply_trusted(a, p, st)
             yield (a, (newboard, -p, st + 1))      
 
+    """The actions, do_action and undo_action functions implement
+    the in-place successor protocol of minimax.search: actions are
+    played on the board of the state and taken back afterwards
+    instead of cloning the board for every successor.
+    """
+    def actions(self, state):
+        b, p, st = state
+        return b.iter_actions(p, st)
+
+    def do_action(self, state, action):
+        b, p, st = state
+        return (b, -p, st + 1), b.do_action(action, p, st, trusted=True)
+
+    def undo_action(self, state, record):
+        state[0].undo(record)
+
+    """The order function sorts the actions before the search tries
+    them: the actions bringing a piece next to the necromancer of the
+    opponent come first.
+    """
+    def order(self, state, actions):
+        b, p, st = state
+        pos = b.necromancer_pos(-p)
+        if pos is None:
+            return actions
+        near = set(b.get_neighbouring_tiles(pos))
+        return sorted(actions, key=lambda a: not a[2] in near)
+
+    """The key function identifies a state in the transposition table:
+    the board hash covers the pieces and the player to play, and steps
+    after the placement phase all follow the same rules.
+    """
+    def key(self, state):
+        b, p, st = state
+        return (b.position_hash, min(st, 9))
+
     """The cutoff function returns true if the alpha-beta/minimax
-    search has to stop; false otherwise.
+    search has to stop; false otherwise. The depth is not limited
+    when max_depth is None, iterative deepening then limits it.
     """
     def cutoff(self, state, depth):
-        if depth >= 2 or state[0].is_finished():
+        if (self.max_depth is not None and depth >= self.max_depth) or \
+                state[0].is_finished():
             return True
 
         return False
@@ -69,10 +131,35 @@ class Agent: #(Agent, minimax.Game):
         It must return an action representing the move the player
         will perform.
         """
+        if self.book is not None:
+            action = self.book.choose(board, step)
+            if action is not None:
+                return action
         self.player = player
         self.time_left = time_left
-        state = (board, player, step)
-        return minimax.search(state, self)
+        state = (board.clone(), player, step)
+        self.ordering.age()
+        if self.mcts is not None:
+            # The simulations are only limited by the budget
+            self.max_depth = None
+            budget = minimax.move_budget(time_left, step)
+            if budget is None:
+                return self.mcts.search(state, iterations=self.iterations)
+            return self.mcts.search(state, budget)
+        if time_left is None:
+            self.max_depth = 2
+            if self.parallel is not None:
+                return self.parallel.search(state, self, inplace=True,
+                                            table=self.table,
+                                            ordering=self.ordering)
+            return minimax.search(state, self, inplace=True, table=self.table,
+                                  ordering=self.ordering)
+        self.max_depth = None
+        budget = minimax.move_budget(time_left, step)
+        return minimax.iterative_search(state, self, budget, inplace=True,
+                                        table=self.table,
+                                        ordering=self.ordering,
+                                        parallel=self.parallel)
 
 
 if __name__ == "__main__":
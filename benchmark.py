@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the Zombies board representations and search.
+Copyright (C) 2014, Université catholique de Louvain
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; version 2 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import concurrent.futures
+import contextlib
+import pickle
+import random
+import time
+import tracemalloc
+import types
+
+from zombies import *
+import basic_agent
+import minimax
+
+
+def random_positions(count, max_step, seed=0, min_step=1):
+    """Return count (board, player, step) triplets reached by random
+    play on a dict Board, with step uniformly drawn between min_step
+    and max_step."""
+    rnd = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = Board()
+        player = PLAYER1
+        last_step = rnd.randint(min_step, max_step)
+        for step in range(1, last_step):
+            if board.is_finished():
+                break
+            board.play_action(rnd.choice(board.get_actions(player, step)),
+                              player, step)
+            player = -player
+        else:
+            positions.append((board, player, last_step))
+    return positions
+
+
+def timeit(fn, items, repeat):
+    """Return the mean time in microseconds of fn over items."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            fn(item)
+    return (time.perf_counter() - start) * 1e6 / (repeat * len(items))
+
+
+def _cold_actions(board, player, step):
+    """Return board.get_actions(player, step) computed with the caches
+    of the position emptied."""
+    board._articulation = board._reachability = board._creeper = None
+    return board.get_actions(player, step)
+
+
+def bench_backends(positions, repeat):
+    """Compare clone and move generation throughput of the backends.
+    The caches of the positions are emptied before each generation, so
+    that all of them are timed."""
+    print("%-10s %12s %14s" % ("backend", "clone (us)", "actions (us)"))
+    for backend in sorted(BACKENDS):
+        boards = [(Board(b, backend=backend), p, st)
+                  for b, p, st in positions]
+        clone = timeit(lambda s: s[0].clone(), boards, repeat * 20)
+        actions = timeit(lambda s: _cold_actions(*s), boards, repeat)
+        print("%-10s %12.2f %14.2f" % (backend, clone, actions))
+
+
+def _successors(board, player, step):
+    """Return the boards reached by each action of player on board."""
+    children = []
+    for action in board.get_actions(player, step):
+        child = board.clone()
+        child.apply_trusted(action, player, step)
+        children.append(child)
+    return children
+
+
+def bench_successors(positions):
+    """Compare the memory held by the successors of positions, all
+    kept alive as in a search tree, and the time to build them."""
+    print("%-10s %12s %14s" % ("backend", "child (us)", "child (bytes)"))
+    for backend in sorted(BACKENDS):
+        boards = [(Board(b, backend=backend), p, st)
+                  for b, p, st in positions]
+        for board, player, step in boards:
+            board.get_actions(player, step)
+        start = time.perf_counter()
+        count = sum(len(_successors(*s)) for s in boards)
+        elapsed = (time.perf_counter() - start) * 1e6 / count
+        tracemalloc.start()
+        children = [_successors(*s) for s in boards]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del children
+        print("%-10s %12.2f %14.0f" % (backend, elapsed, size / count))
+
+
+def _baseline_state(board):
+    """Return the state a Board held before the indexes: its pieces,
+    unplaced pieces and side to move."""
+    pieces = {}
+    for pos, value in board.pieces.items():
+        pieces[pos] = list(value) if type(value) is list else value
+    return types.SimpleNamespace(pieces=pieces,
+                                 unplaced_pieces=dict(board.unplaced_pieces),
+                                 side_to_move=board.side_to_move)
+
+
+def bench_encoding(positions, repeat):
+    """Compare the size and the encoding and decoding times of the
+    boards of positions: pickled as boards were before the indexes,
+    pickled now, and encoded by to_bytes, on the dict and compact
+    backends. A pickled CompactBoard is its whole buffer, indexes
+    included, which to_bytes has to rebuild."""
+    boards = [board for board, player, step in positions]
+    compact = [Board(board, backend="compact") for board in boards]
+    print("%-16s %10s %12s %12s" % ("encoding", "bytes", "encode (us)",
+                                    "decode (us)"))
+    for name, items, dump, load in (
+            ("baseline", [_baseline_state(b) for b in boards],
+             pickle.dumps, pickle.loads),
+            ("pickle", boards, pickle.dumps, pickle.loads),
+            ("to_bytes", boards, Board.to_bytes, Board),
+            ("pickle compact", compact, pickle.dumps, pickle.loads),
+            ("to_bytes compact", compact, Board.to_bytes,
+             lambda data: Board(data, backend="compact"))):
+        data = [dump(item) for item in items]
+        size = sum(len(d) for d in data) / len(data)
+        dumps = timeit(dump, items, repeat)
+        loads = timeit(load, data, repeat)
+        print("%-16s %10.1f %12.2f %12.2f" % (name, size, dumps, loads))
+
+
+def _fixpoint_sprinter_moves(board, sprinter_pos):
+    """The sprinter moves as computed before Board.reachable_tiles: all
+    the empty tiles are scanned against all the tiles attained so far
+    until no new one is found."""
+    sprinter_moves = [sprinter_pos]
+    empty_tiles = board.get_empty_tiles()
+    new_component_found = True
+    while new_component_found:
+        new_component_found = False
+        for empty_tile in list(empty_tiles):
+            for attainable_tile in sprinter_moves:
+                if board.respects_move_liberty(attainable_tile, empty_tile) \
+                        and not board.is_position_isolated(empty_tile,
+                                                           sprinter_pos):
+                    empty_tiles.remove(empty_tile)
+                    sprinter_moves.append(empty_tile)
+                    new_component_found = True
+                    break
+    sprinter_moves.remove(sprinter_pos)
+    return sprinter_moves
+
+
+def bench_sprinter(positions, repeat):
+    """Compare the sprinter reachability flood fills on the pieces of
+    positions, which should be late-game ones with long perimeters."""
+    starts = []
+    for board, player, step in positions:
+        for pos in board.pieces:
+            if board.pieces[pos] != EMPTY and type(board.pieces[pos]) is int:
+                starts.append((board, pos))
+    empty = sum(len(b.get_empty_tiles()) for b, p, st in positions)
+    print("%d pieces, %.1f empty tiles per board" %
+          (len(starts), empty / len(positions)))
+    print("%-14s %10s" % ("method", "time (us)"))
+    fixpoint = timeit(lambda s: _fixpoint_sprinter_moves(*s), starts, repeat)
+    print("%-14s %10.2f" % ("fixpoint", fixpoint))
+    for backend in sorted(BACKENDS):
+        boards = [(Board(b, backend=backend), pos) for b, pos in starts]
+        bfs = timeit(lambda s: s[0].reachable_tiles(s[1]), boards, repeat)
+        print("%-14s %10.2f" % ("bfs " + backend, bfs))
+
+
+# The moves towards each neighbour and their two flank offsets, in the
+# order of the former if/elif chain of Board.respects_move_liberty
+_LIBERTY_CHAIN = (((1, -1), (0, -1), (1, 0)), ((1, 0), (1, -1), (0, 1)),
+                  ((0, 1), (1, 0), (-1, 1)), ((-1, 1), (0, 1), (-1, 0)),
+                  ((-1, 0), (0, -1), (-1, 1)), ((0, -1), (1, -1), (-1, 0)))
+
+
+class _ChainGeometryBoard(Board):
+    """Board computing its neighbours and the move liberty as before the
+    geometry tables of zombies: a fresh list of neighbours per call, and
+    a scan of the six directions with four dict lookups for the gate."""
+
+    def get_neighbouring_tiles(self, pos):
+        q, r = pos
+        neighbour_deltas = [(1, 0), (1, -1), (0, -1), (-1, 0), (-1, 1),
+                            (0, 1)]
+        neighbour_tiles = []
+        for (delta_q, delta_r) in neighbour_deltas:
+            neighbour_tiles.append((q + delta_q, r + delta_r))
+        return neighbour_tiles
+
+    def get_non_empty_neighbours(self, pos):
+        non_empty_neighbours = []
+        for neighbour_pos in self.get_neighbouring_tiles(pos):
+            if neighbour_pos in self._tops and \
+                    self._tops[neighbour_pos] != EMPTY:
+                non_empty_neighbours.append(neighbour_pos)
+        return non_empty_neighbours
+
+    def respects_move_liberty(self, pos1, pos2):
+        if not pos1 in self._tops:
+            raise NonExistingTile(pos1)
+        if not pos2 in self._tops:
+            raise NonExistingTile(pos2)
+        if self._tops[pos2] != EMPTY:
+            return False
+        q1, r1 = pos1
+        q2, r2 = pos2
+        for (dq, dr), (lq, lr), (rq, rr) in _LIBERTY_CHAIN:
+            if q2 - q1 == dq and r2 - r1 == dr:
+                left = (q1 + lq, r1 + lr)
+                right = (q1 + rq, r1 + rr)
+                return (not left in self._tops) or \
+                    (not right in self._tops) or \
+                    self._tops[left] == EMPTY or \
+                    self._tops[right] == EMPTY
+        return False
+
+
+def bench_geometry(positions, repeat):
+    """Compare the move generation of the dict Board with the neighbour
+    and gate tables and with the former per-call geometry."""
+    print("%-10s %14s %14s" % ("geometry", "actions (us)", "liberty (us)"))
+    for name, cls in (("chain", _ChainGeometryBoard), ("tables", Board)):
+        boards = [(cls(b), p, st) for b, p, st in positions]
+        pairs = [(board, pos, new_pos) for board, p, st in boards
+                 for pos in board.pieces
+                 for new_pos in board.get_neighbouring_tiles(pos)
+                 if new_pos in board.pieces]
+        actions = timeit(lambda s: _cold_actions(*s), boards, repeat)
+        liberty = timeit(lambda s: s[0].respects_move_liberty(s[1], s[2]),
+                         pairs, repeat)
+        print("%-10s %14.2f %14.2f" % (name, actions, liberty))
+
+
+def bench_ordering(positions, depth):
+    """Compare fixed-depth alpha-beta searches of the basic agent with
+    and without move ordering. The counts are per position."""
+    print("%-10s %10s %10s %10s %10s" %
+          ("ordering", "nodes", "cutoffs", "first", "branching"))
+    for name in ("none", "static", "dynamic"):
+        agent = basic_agent.Agent()
+        agent.max_depth = depth
+        if name == "none":
+            agent.order = lambda state, actions: actions
+        stats = minimax.SearchStats()
+        for board, player, step in positions:
+            agent.player = player
+            ordering = minimax.MoveOrdering() if name != "none" else None
+            if name == "static":
+                ordering.cutoff = lambda action, depth, draft: None
+            minimax.search((Board(board, backend="compact"), player, step),
+                           agent, inplace=True, ordering=ordering,
+                           stats=stats)
+        # The average tree, and its branching factor
+        stats.nodes //= len(positions)
+        stats.cutoffs //= len(positions)
+        stats.first_cutoffs //= len(positions)
+        print("%-10s %10d %10d %10d %10.2f" %
+              (name, stats.nodes, stats.cutoffs, stats.first_cutoffs,
+               stats.branching_factor()))
+
+
+def bench_pvs(positions, depth, aspiration):
+    """Compare iterative deepening searches of the basic agent with plain
+    alpha-beta, principal variation search and aspiration windows. The
+    actions found are compared with the ones of plain alpha-beta, which
+    they may only differ from among actions of equal value. With the
+    score of the basic agent, aspiration windows are no gain: see
+    minimax.iterative_search."""
+    print("%-10s %12s %10s %10s" % ("search", "evaluations", "time (s)",
+                                    "same"))
+    reference = None
+    for name, pvs, window in (("alphabeta", False, None),
+                              ("pvs", True, None),
+                              ("aspiration", True, aspiration)):
+        agent = basic_agent.Agent()
+        agent.max_depth = None
+        stats = minimax.SearchStats()
+        actions = []
+        start = time.perf_counter()
+        for board, player, step in positions:
+            agent.player = player
+            actions.append(minimax.iterative_search(
+                (Board(board, backend="compact"), player, step), agent,
+                max_depth=depth, inplace=True,
+                table=minimax.TranspositionTable(),
+                ordering=minimax.MoveOrdering(), stats=stats, pvs=pvs,
+                aspiration=window))
+        elapsed = time.perf_counter() - start
+        if reference is None:
+            reference = actions
+        same = sum(a == b for a, b in zip(actions, reference))
+        print("%-10s %12d %10.2f %7d/%d" % (name, stats.evaluations, elapsed,
+                                            same, len(positions)))
+
+
+def _lazy_smp_search(table, board, player, step, depth, seed):
+    """Search a position in a worker process, trying the actions in an
+    order of its own. Return the hits and misses of table, a private
+    one if table is None."""
+    agent = basic_agent.Agent()
+    agent.player = player
+    agent.max_depth = None
+    rnd = random.Random(seed)
+    agent.order = lambda state, actions: rnd.sample(actions, len(actions))
+    if table is None:
+        table = minimax.TranspositionTable()
+    minimax.iterative_search((Board(board, backend="compact"), player, step),
+                             agent, max_depth=depth, inplace=True,
+                             table=table, ordering=minimax.MoveOrdering())
+    return table.hits, table.misses
+
+
+def bench_shared_table(positions, depth, workers):
+    """Compare the hit rates of per-process and shared transposition
+    tables when workers processes search each position (lazy SMP)."""
+    print("%-10s %10s %10s %10s" % ("table", "hits", "misses", "time (s)"))
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        for name in ("private", "shared"):
+            hits = misses = 0
+            start = time.perf_counter()
+            for board, player, step in positions:
+                table = None
+                if name == "shared":
+                    table = minimax.SharedTranspositionTable()
+                with contextlib.ExitStack() as stack:
+                    if table is not None:
+                        stack.enter_context(table)
+                    futures = [executor.submit(_lazy_smp_search, table, board,
+                                               player, step, depth, seed)
+                               for seed in range(workers)]
+                    for future in futures:
+                        h, m = future.result()
+                        hits += h
+                        misses += m
+            elapsed = time.perf_counter() - start
+            print("%-10s %9.1f%% %9.1f%% %10.2f" %
+                  (name, 100 * hits / (hits + misses),
+                   100 * misses / (hits + misses), elapsed))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--positions", type=int, default=50,
+                        help="number of random positions (default:" +
+                             " %(default)s)")
+    parser.add_argument("--max-step", type=int, default=60,
+                        help="latest step of the random positions" +
+                             " (default: %(default)s)")
+    parser.add_argument("-r", "--repeat", type=int, default=5,
+                        help="number of passes over the positions" +
+                             " (default: %(default)s)")
+    parser.add_argument("-d", "--depth", type=int, default=2,
+                        help="depth of the searches comparing move" +
+                             " orderings (default: %(default)s)")
+    parser.add_argument("-w", "--aspiration", type=float, default=2,
+                        help="half-width of the aspiration windows" +
+                             " (default: %(default)s)")
+    parser.add_argument("-j", "--workers", type=int, default=4,
+                        help="number of processes sharing a transposition" +
+                             " table (default: %(default)s)")
+    parser.add_argument("-s", "--seed", type=int, default=0,
+                        help="random seed (default: %(default)s)")
+    args = parser.parse_args()
+
+    positions = random_positions(args.positions, args.max_step, args.seed)
+    bench_backends(positions, args.repeat)
+    print()
+    bench_successors(positions)
+    print()
+    bench_encoding(positions, args.repeat)
+    print()
+    late = random_positions(args.positions, 2 * args.max_step, args.seed,
+                            args.max_step)
+    bench_sprinter(late, args.repeat)
+    print()
+    bench_geometry(positions, args.repeat)
+    print()
+    bench_ordering(positions, args.depth)
+    print()
+    bench_pvs(positions, args.depth, args.aspiration)
+    print()
+    bench_shared_table(positions, args.depth, args.workers)
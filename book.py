@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Opening book for the placement phase of Zombies.
+Copyright (C) 2014, Université catholique de Louvain
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; version 2 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+
+import zombies
+
+# The placement phase: the book covers the actions of steps 1 to MAX_STEP
+MAX_STEP = 8
+
+# File layout: the header, a table of slots, then the records. A slot
+# holds the 8-byte digest of a key and the offset of its record, 0 for
+# an empty slot, and is found by linear probing from the digest. A
+# record holds the length of the key and the number of moves, the key,
+# then for each move its action in the canonical position and the
+# number of games, wins and losses of the player who played it.
+_MAGIC = b"ZOMBOOK\0"
+# The keys are Board.canonical_key encodings: the version follows theirs
+_VERSION = 2
+_HEADER = struct.Struct("<8sHHII")
+_SLOT = struct.Struct("<QQ")
+_RECORD = struct.Struct("<HH")
+_MOVE = struct.Struct("<c4hIII")
+
+
+def _digest(key):
+    """Returns the 64-bit hash of key used to place it in the table."""
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(),
+                          "little")
+
+
+def _position_key(board, step):
+    """Returns (key, symmetry): the book key of board at step, and the
+    symmetry mapping board to its canonical position."""
+    key, symmetry = board.canonical_key()
+    return bytes([step]) + key, symmetry
+
+
+def _pack_action(action):
+    """Returns the kind and the 4 numbers of action, as stored in a
+    move."""
+    kind, first, second = action
+    return kind.encode(), tuple(first) + tuple(second)
+
+
+def _unpack_action(kind, numbers):
+    """Returns the action stored as kind and numbers by _pack_action."""
+    return (kind.decode(), numbers[:2], numbers[2:])
+
+
+class BookBuilder:
+
+    """Collect the moves of played games into an opening book.
+
+    The moves are gathered by position, up to the symmetries of the
+    grid, and the equivalent moves of a position, leading to the same
+    canonical position, are merged. Each move counts the games in which
+    it was played and their results for the player who played it.
+
+    """
+
+    def __init__(self, max_step=MAX_STEP):
+        """Create an empty book of the actions of steps 1 to max_step."""
+        self.max_step = max_step
+        self.positions = {}
+        self.games = 0
+
+    def add_game(self, board, actions, winner):
+        """Add the moves of a game.
+
+        Arguments:
+        board -- the initial board, left unchanged
+        actions -- the sequence of the (player, action, ...) tuples
+            played from step 1, as in game.Trace.actions
+        winner -- the result of the game (>0: Player 1 has won, <0:
+            Player 2 has won, 0: draw game)
+
+        """
+        board = board.clone()
+        result = (winner > 0) - (winner < 0)
+        for step, (player, action, *_) in enumerate(actions, 1):
+            if step > self.max_step:
+                break
+            key, symmetry = _position_key(board, step)
+            board.play_action(action, player, step)
+            child, _ = board.canonical_key()
+            moves = self.positions.setdefault(key, {})
+            move = moves.get(child)
+            if move is None:
+                move = moves[child] = [symmetry.map_action(action), 0, 0, 0]
+            move[1] += 1
+            if result * player > 0:
+                move[2] += 1
+            elif result * player < 0:
+                move[3] += 1
+        self.games += 1
+
+    def add_trace(self, trace):
+        """Add the moves of a game.Trace."""
+        self.add_game(trace.get_initial_board(), trace.actions, trace.winner)
+
+    def write(self, path):
+        """Write the book to the file path."""
+        slots = 1
+        while slots < 2 * len(self.positions):
+            slots *= 2
+        table = [None] * slots
+        records = []
+        offset = _HEADER.size + slots * _SLOT.size
+        for key, moves in self.positions.items():
+            digest = _digest(key)
+            index = digest & (slots - 1)
+            while table[index] is not None:
+                index = (index + 1) & (slots - 1)
+            table[index] = (digest, offset)
+            moves = sorted(moves.values(), key=lambda m: -m[1])
+            record = [_RECORD.pack(len(key), len(moves)), key]
+            for action, games, wins, losses in moves:
+                kind, numbers = _pack_action(action)
+                record.append(_MOVE.pack(kind, *numbers, games, wins, losses))
+            record = b"".join(record)
+            records.append(record)
+            offset += len(record)
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, self.max_step, slots,
+                                 len(self.positions)))
+            for slot in table:
+                f.write(_SLOT.pack(*slot) if slot is not None else
+                        bytes(_SLOT.size))
+            for record in records:
+                f.write(record)
+
+
+class Book:
+
+    """Read-only opening book written by BookBuilder.
+
+    The file is mapped in memory and a lookup only reads the slots it
+    probes and the record it finds, so that opening even a large book
+    is instantaneous.
+
+    """
+
+    def __init__(self, path):
+        """Open the book in the file path. Raise ValueError if it is not
+        a book."""
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < _HEADER.size:
+            self.close()
+            raise ValueError("%s is not an opening book" % path)
+        magic, version, self.max_step, self.slots, self.entries = \
+            _HEADER.unpack_from(self.data)
+        if magic != _MAGIC or version != _VERSION:
+            self.close()
+            raise ValueError("%s is not an opening book" % path)
+
+    def close(self):
+        """Unmap the file."""
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.entries
+
+    def _record(self, key):
+        """Returns (offset, count): the offset of the moves of the record
+        of key and their number, or None if key is not in the book."""
+        digest = _digest(key)
+        index = digest & (self.slots - 1)
+        while True:
+            slot_digest, offset = _SLOT.unpack_from(
+                self.data, _HEADER.size + index * _SLOT.size)
+            if offset == 0:
+                return None
+            if slot_digest == digest:
+                length, count = _RECORD.unpack_from(self.data, offset)
+                start = offset + _RECORD.size
+                if self.data[start:start + length] == key:
+                    return start + length, count
+            index = (index + 1) & (self.slots - 1)
+
+    def moves(self, board, step):
+        """Returns the list of the (action, games, wins, losses) moves of
+        the book for board at step, the most played first, or an empty
+        list if the position is not in the book. The actions are those
+        of board, the results those of the player to play."""
+        if step > self.max_step:
+            return []
+        key, symmetry = _position_key(board, step)
+        found = self._record(key)
+        if found is None:
+            return []
+        offset, count = found
+        moves = []
+        for kind, *numbers, games, wins, losses in \
+                _MOVE.iter_unpack(self.data[offset:offset + count * _MOVE.size]):
+            action = symmetry.unmap_action(_unpack_action(kind, tuple(numbers)))
+            moves.append((action, games, wins, losses))
+        return moves
+
+    def choose(self, board, step, min_games=1):
+        """Returns the action of the book with the best expected score
+        for the player to play on board at step, among the moves played
+        in at least min_games games, or None if there is none. Draws
+        count as half wins, and each move starts with one win and one
+        loss, so that a move won once does not beat a move won 9 times
+        out of 10."""
+        best = None
+        best_score = None
+        for action, games, wins, losses in self.moves(board, step):
+            if games < min_games:
+                continue
+            draws = games - wins - losses
+            score = (wins + draws / 2 + 1) / (games + 2)
+            if best_score is None or score > best_score:
+                best = action
+                best_score = score
+        return best
+
+
+def open_book(path=None):
+    """Returns the Book in the file path, by default the one named by the
+    ZOMBIES_BOOK environment variable, or None if there is none."""
+    if path is None:
+        path = os.environ.get("ZOMBIES_BOOK")
+    if not path:
+        return None
+    return Book(path)
+
+
+class _TraceUnpickler(pickle.Unpickler):
+
+    """Unpickler for the traces written by game.py, in which the Trace
+    class is that of the __main__ module."""
+
+    def find_class(self, module, name):
+        if module == "__main__" and name == "Trace":
+            import game
+            return game.Trace
+        return super().find_class(module, name)
+
+
+def load_traces(path):
+    """Returns the list of the traces pickled one after the other in the
+    file path."""
+    traces = []
+    with open(path, "rb") as f:
+        while True:
+            try:
+                traces.append(_TraceUnpickler(f).load())
+            except EOFError:
+                return traces
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        usage="%(prog)s [options] -o BOOK TRACE...\n" +
+              "       %(prog)s [options] BOOK")
+    parser.add_argument("files", nargs='+', metavar="FILE",
+                        help="the trace files written by game.py -w to" +
+                             " build the book from, or the book to show")
+    parser.add_argument("-o", "--output", metavar="BOOK",
+                        help="build the book from the traces and write it" +
+                             " to BOOK")
+    parser.add_argument("--max-step", type=int, default=MAX_STEP,
+                        help="last step covered by the book (default:" +
+                             " %(default)s)")
+    args = parser.parse_args()
+
+    if args.output is not None:
+        builder = BookBuilder(args.max_step)
+        for path in args.files:
+            for trace in load_traces(path):
+                builder.add_trace(trace)
+        builder.write(args.output)
+        print("%d games, %d positions written to %s" %
+              (builder.games, len(builder.positions), args.output))
+    else:
+        # Show the moves of the book for the main line of the default board
+        with Book(args.files[0]) as book:
+            print("%d positions up to step %d" % (len(book), book.max_step))
+            board = zombies.Board()
+            player = zombies.PLAYER1
+            for step in range(1, book.max_step + 1):
+                moves = book.moves(board, step)
+                if not moves:
+                    break
+                print("Step", step)
+                for action, games, wins, losses in moves:
+                    print("  %-28s %6d games %6d wins %6d losses" %
+                          (action, games, wins, losses))
+                board.play_action(book.choose(board, step), player, step)
+                player = -player
@@ -387,6 +387,9 @@ if __name__ == "__main__":
                    help="set the time credit per player (default: untimed" +
                         " game)",
                    metavar="SECONDS")
+    g.add_argument("--backend", choices=sorted(BACKENDS), default="dict",
+                   help="set the board representation (default:" +
+                        " %(default)s)")
     g = parser.add_argument_group("Replay options")
     g.add_argument("-s", "--speed", type=posfloatarg,
                    help="set the duration of each step in seconds or scale" +
@@ -421,7 +424,7 @@ if __name__ == "__main__":
         board = trace.get_initial_board()
     else:
         # default board
-        board = Board()
+        board = Board(backend=args.backend)
 
     # Create viewer
     if args.headless:
@@ -0,0 +1,266 @@
+"""
+Monte-Carlo Tree Search (UCT) algorithm.
+Copyright (C) 2014, Université catholique de Louvain
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; version 2 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import math
+import random
+import time
+
+
+def random_policy(game, state, rnd):
+    """Rollout policy playing a uniformly random action of
+    game.actions(state)."""
+    actions = list(game.actions(state))
+    return rnd.choice(actions) if actions else None
+
+
+def random_successor(game, state, rnd):
+    """Return a uniformly random successor state of state, or None if
+    there is none. All the successors are built."""
+    chosen = None
+    for i, (a, s) in enumerate(game.successors(state)):
+        if rnd.randrange(i + 1) == 0:
+            chosen = s
+    return chosen
+
+
+class Node:
+
+    """Node of the search tree.
+
+    Attributes:
+    state -- the state of the node
+    action -- the action leading from the parent to the node
+    parent -- the parent node, or None for the root
+    children -- the expanded children
+    pending -- iterator over the successors not expanded yet, or None
+        once all have been
+    visits -- number of simulations through the node
+    total -- sum of the values of these simulations, for MAX
+
+    """
+
+    def __init__(self, state, action=None, parent=None):
+        self.state = state
+        self.action = action
+        self.parent = parent
+        self.children = []
+        self.pending = None
+        self.visits = 0
+        self.total = 0.0
+
+    def mean(self):
+        """Return the mean value of the simulations through the node."""
+        return self.total / self.visits if self.visits else 0.0
+
+
+class MCTS:
+
+    """Monte-Carlo Tree Search with UCT selection.
+
+    The game is a minimax.Game: nodes are expanded with successors, the
+    simulations stop when cutoff returns True or after rollout_depth
+    actions, and the state they reach is scored with evaluate, from the
+    point of view of MAX, the player of the root. As in minimax, MAX and
+    MIN play in turns.
+
+    With progressive widening, a node visited n times has at most
+    ceil(widening * (n + 1) ** exponent) children, expanded in the order
+    of game.successors, which should yield the most promising actions
+    first. The tree is kept between searches: when the next search
+    starts from a descendant of the previous root (up to two plies
+    below, i.e. after the reply of the opponent), its subtree is reused.
+
+    """
+
+    def __init__(self, game, exploration=1.4, widening=2.0, exponent=0.5,
+                 rollout_depth=10, policy=None, inplace=False, seed=None):
+        """Create the engine.
+
+        Arguments:
+        game -- a concrete instance of class minimax.Game
+        exploration -- the exploration constant of UCT, for values
+            normalized to [0, 1] with the extreme values seen so far
+        widening, exponent -- the progressive widening parameters, or
+            None as widening to expand all the successors
+        rollout_depth -- the maximum number of actions of a rollout
+        policy -- a function (game, state, rnd) returning the action to
+            play in state during the rollouts, rnd being a random.Random,
+            or None to play random actions
+        inplace -- whether to play the rollouts with the in-place
+            successor protocol of game instead of successors, which
+            random rollouts then draw from
+        seed -- the seed of the random generator of the rollouts
+
+        """
+        self.game = game
+        self.exploration = exploration
+        self.widening = widening
+        self.exponent = exponent
+        self.rollout_depth = rollout_depth
+        self.policy = policy
+        self.inplace = inplace
+        self.rnd = random.Random(seed)
+        self.root = None
+        self.low = math.inf
+        self.high = -math.inf
+        self.iterations = 0
+
+    def search(self, state, budget=None, iterations=None):
+        """Search state and return the best action.
+
+        The search runs until budget seconds have elapsed or iterations
+        simulations have been run; at least one of them must be given.
+        The best action is the one of the most visited child.
+
+        """
+        if budget is None and iterations is None:
+            raise ValueError("search needs a budget or a number of iterations")
+        deadline = None
+        if budget is not None:
+            deadline = time.perf_counter() + budget
+        self.root = self.reuse(state)
+        self.iterations = 0
+        while (iterations is None or self.iterations < iterations) and \
+                (deadline is None or time.perf_counter() < deadline):
+            self.simulate()
+            self.iterations += 1
+        if not self.root.children:
+            self.expand(self.root)
+        if not self.root.children:
+            return None
+        return max(self.root.children, key=lambda n: n.visits).action
+
+    def reuse(self, state):
+        """Return the node of the previous tree holding state, detached
+        from its parent, or a new node if there is none."""
+        key = self.game.key(state)
+        nodes = [self.root] if self.root is not None else []
+        for depth in range(2):
+            # Only MAX nodes, at even depths, can become the root
+            for node in nodes:
+                if self.game.key(node.state) == key:
+                    node.parent = None
+                    node.action = None
+                    return node
+            nodes = [grandchild for node in nodes
+                     for child in node.children
+                     for grandchild in child.children]
+        self.low = math.inf
+        self.high = -math.inf
+        return Node(state)
+
+    def simulate(self):
+        """Run one simulation: select a node, expand it, play a rollout
+        from it and back its value up."""
+        node = self.root
+        depth = 0
+        while not self.game.cutoff(node.state, depth):
+            if self.expandable(node):
+                child = self.expand(node)
+                if child is not None:
+                    node = child
+                    depth += 1
+                    break
+            if not node.children:
+                break
+            node = self.select(node, depth % 2 == 0)
+            depth += 1
+        value = self.rollout(node.state, depth)
+        self.low = min(self.low, value)
+        self.high = max(self.high, value)
+        while node is not None:
+            node.visits += 1
+            node.total += value
+            node = node.parent
+
+    def expandable(self, node):
+        """Return whether node may get a new child."""
+        if node.pending is None and node.children:
+            return False
+        if self.widening is None:
+            return True
+        limit = math.ceil(self.widening * (node.visits + 1) ** self.exponent)
+        return len(node.children) < limit
+
+    def expand(self, node):
+        """Add the next successor of node to its children and return it,
+        or None if all have been added."""
+        if node.pending is None:
+            if node.children:
+                return None
+            node.pending = iter(self.game.successors(node.state))
+        for action, state in node.pending:
+            child = Node(state, action, node)
+            node.children.append(child)
+            return child
+        node.pending = None
+        return None
+
+    def select(self, node, maximize):
+        """Return the child of node with the best UCT score."""
+        scale = self.high - self.low
+        log_visits = math.log(node.visits + 1)
+        best = None
+        best_score = -math.inf
+        for child in node.children:
+            if child.visits == 0:
+                return child
+            score = 0.5
+            if scale > 0:
+                score = (child.mean() - self.low) / scale
+            if not maximize:
+                score = 1.0 - score
+            score += self.exploration * math.sqrt(log_visits / child.visits)
+            if score > best_score:
+                best = child
+                best_score = score
+        return best
+
+    def rollout(self, state, depth):
+        """Play the policy from state, at depth in the tree, for at most
+        rollout_depth actions and return the value of the state reached.
+        state is left unchanged."""
+        game = self.game
+        policy = self.policy
+        if policy is None and self.inplace:
+            policy = random_policy
+        played = []
+        try:
+            for _ in range(self.rollout_depth):
+                if game.cutoff(state, depth):
+                    break
+                if policy is None:
+                    child = random_successor(game, state, self.rnd)
+                else:
+                    action = policy(game, state, self.rnd)
+                    if action is None:
+                        break
+                    if self.inplace:
+                        child, record = game.do_action(state, action)
+                        played.append((child, record))
+                    else:
+                        child = next(s for a, s in game.successors(state)
+                                     if a == action)
+                if child is None:
+                    break
+                state = child
+                depth += 1
+            return game.evaluate(state)
+        finally:
+            for child, record in reversed(played):
+                game.undo_action(child, record)
@@ -17,6 +17,19 @@ along with this program; if not, see <http://www.gnu.org/licenses/>.
 
 """
 
+import collections
+import concurrent.futures
+import contextlib
+import marshal
+import math
+import multiprocessing
+import multiprocessing.resource_tracker
+import multiprocessing.shared_memory
+import os
+import pickle
+import struct
+import time
+
 
 class Game:
 
@@ -39,51 +52,909 @@ class Game:
         """Return the evaluation of state."""
         abstract
 
+    # The following methods form the optional in-place successor
+    # protocol, used by search(..., inplace=True) instead of
+    # successors. They let the search play and take back actions on
+    # a single state rather than building a new state per child.
+
+    def actions(self, state):
+        """Return the actions playable in state, as a list or as an
+        iterator. An iterator is only consumed as the search reaches
+        its actions, with state restored by undo_action, so that the
+        actions after a cutoff are never generated."""
+        abstract
+
+    def do_action(self, state, action):
+        """Play action on state in place.
+
+        Return a pair (s, record) in which s is the resulting state
+        and record is given back to undo_action to restore state.
+
+        """
+        abstract
+
+    def undo_action(self, state, record):
+        """Take back the action which returned record, state being
+        the state do_action returned."""
+        abstract
+
+    def key(self, state):
+        """Return a hashable key identifying state in a transposition
+        table. It must not change when state is modified in place.
+
+        """
+        return state
+
+    def order(self, state, actions):
+        """Return actions in the order in which search(..., ordering=...)
+        should try them before applying its own heuristics. This should
+        be cheap, e.g. a static score of the actions.
+
+        """
+        return actions
+
 
 inf = float("inf")
 
 
-def search(state, game, prune=True):
+class SearchTimeout(Exception):
+    """Raised when a search runs past its deadline."""
+
+
+# Bound types of transposition table entries
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+TTEntry = collections.namedtuple("TTEntry", "key value bound depth move")
+
+
+class TranspositionTable:
+
+    """Bounded transposition table for search.
+
+    Each of the size buckets holds two entries: a depth-preferred one,
+    only replaced by entries searched at least as deep, and an
+    always-replace one receiving the others. An entry records the value
+    of a position, whether it is EXACT or only a LOWER or UPPER bound,
+    the depth it was searched to and the best move found.
+
+    The hits, misses and collisions attributes count the lookups which
+    found the position, did not find it, and did not find it because
+    its bucket was used by other positions.
+
+    """
+
+    def __init__(self, size=1 << 16):
+        self.size = size
+        self.clear()
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        self.deep = [None] * self.size
+        self.recent = [None] * self.size
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    def lookup(self, key):
+        """Return the entry of key, or None if there is none."""
+        i = hash(key) % self.size
+        deep = self.deep[i]
+        if deep is not None and deep.key == key:
+            self.hits += 1
+            return deep
+        recent = self.recent[i]
+        if recent is not None and recent.key == key:
+            self.hits += 1
+            return recent
+        self.misses += 1
+        if deep is not None or recent is not None:
+            self.collisions += 1
+        return None
+
+    def store(self, key, value, bound, depth, move):
+        """Store an entry for key."""
+        i = hash(key) % self.size
+        entry = TTEntry(key, value, bound, depth, move)
+        deep = self.deep[i]
+        if deep is None or deep.key == key or depth >= deep.depth:
+            self.deep[i] = entry
+        else:
+            self.recent[i] = entry
+
+
+# Layout of the records of a SharedTranspositionTable: a check word,
+# the value, a word with the other fields and 4 words of marshalled
+# move. The check word is the key XORed with all the other words.
+_RECORD = struct.Struct("<7Q")
+_RECORD_SIZE = _RECORD.size
+_MOVE_SIZE = 32
+_MASK64 = (1 << 64) - 1
+_DOUBLE = struct.Struct("<d")
+_WORD = struct.Struct("<Q")
+_MOVE_WORDS = struct.Struct("<4Q")
+_USED = 1 << 48
+_FLOAT = 1 << 34
+
+
+def _attach_shared_memory(name):
+    """Attach to the existing shared memory block name.
+
+    Before Python 3.13, attaching registers the block with the resource
+    tracker of the process, which destroys it when the process exits
+    while other processes may still use it: registration is disabled.
+
+    """
+    try:
+        return multiprocessing.shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        pass
+    tracker = multiprocessing.resource_tracker
+    register = tracker.register
+    tracker.register = lambda name, rtype: None
+    try:
+        return multiprocessing.shared_memory.SharedMemory(name)
+    finally:
+        tracker.register = register
+
+
+class SharedTranspositionTable:
+
+    """Lossy transposition table in shared memory.
+
+    The table works as TranspositionTable does, with the same two
+    entries per bucket and replacement scheme, but its records live in
+    a multiprocessing.shared_memory block, so that all the processes
+    searching with it share their results. The table can be pickled
+    and sent to other processes, which then attach to the same block.
+
+    There is no lock: the check word of a record is the hash of its key
+    XORed with its other words, so that a record torn by concurrent
+    writers no longer matches any key and is ignored. Only hashes of
+    the keys are stored, so they must be equal in all processes
+    (tuples of ints are, strings are only with forked processes).
+    Values must be ints or floats; moves are stored when their marshal
+    form has at most 32 bytes, and are lost otherwise.
+
+    The block is destroyed when the process which created the table
+    calls close (or leaves its with statement).
+
+    """
+
+    def __init__(self, size=1 << 16, name=None):
+        self.size = size
+        if name is None:
+            self.shm = multiprocessing.shared_memory.SharedMemory(
+                create=True, size=2 * size * _RECORD_SIZE)
+            self.owner = True
+        else:
+            self.shm = _attach_shared_memory(name)
+            self.owner = False
+        self.buf = self.shm.buf
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    def __getstate__(self):
+        return self.size, self.shm.name
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Detach from the block, and destroy it if this process
+        created the table."""
+        if self.buf is None:
+            return
+        self.buf.release()
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def clear(self):
+        """Remove all entries and reset the counters of this process."""
+        self.buf[:] = bytes(len(self.buf))
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    def _read(self, offset, key):
+        """Return (used, entry) for the record at offset, entry being
+        None unless the record is valid and holds key."""
+        check, value, meta, m0, m1, m2, m3 = _RECORD.unpack_from(self.buf,
+                                                                  offset)
+        if not meta & _USED:
+            return False, None
+        if check ^ value ^ meta ^ m0 ^ m1 ^ m2 ^ m3 != key:
+            return True, None
+        if meta & _FLOAT:
+            value = _DOUBLE.unpack(_WORD.pack(value))[0]
+        elif value >> 63:
+            value -= 1 << 64
+        depth = meta & 0xffffffff
+        if depth >> 31:
+            depth -= 1 << 32
+        length = (meta >> 40) & 0xff
+        move = None
+        if length:
+            move = marshal.loads(_MOVE_WORDS.pack(m0, m1, m2, m3)[:length])
+        return True, (value, (meta >> 32) & 0x3, depth, move)
+
+    def lookup(self, key):
+        """Return the entry of key, or None if there is none."""
+        h = hash(key) & _MASK64
+        offset = h % self.size * 2 * _RECORD_SIZE
+        used = False
+        for record in (offset, offset + _RECORD_SIZE):
+            in_use, entry = self._read(record, h)
+            if entry is not None:
+                self.hits += 1
+                return TTEntry(key, *entry)
+            used = used or in_use
+        self.misses += 1
+        if used:
+            self.collisions += 1
+        return None
+
+    def store(self, key, value, bound, depth, move):
+        """Store an entry for key."""
+        h = hash(key) & _MASK64
+        offset = h % self.size * 2 * _RECORD_SIZE
+        meta = _USED | bound << 32 | (depth & 0xffffffff)
+        if type(value) is float or not -1 << 63 <= value < 1 << 63:
+            meta |= _FLOAT
+            value = _WORD.unpack(_DOUBLE.pack(value))[0]
+        else:
+            value &= _MASK64
+        moves = b""
+        if move is not None:
+            moves = marshal.dumps(move)
+            if len(moves) > _MOVE_SIZE:
+                moves = b""
+        meta |= len(moves) << 40
+        m0, m1, m2, m3 = _MOVE_WORDS.unpack(moves.ljust(_MOVE_SIZE, b"\0"))
+        check = h ^ value ^ meta ^ m0 ^ m1 ^ m2 ^ m3
+        # Depth-preferred record first, as in TranspositionTable
+        used, deep = self._read(offset, h)
+        if used and deep is None:
+            deep_depth = self._depth(offset)
+            if depth < deep_depth:
+                offset += _RECORD_SIZE
+        _RECORD.pack_into(self.buf, offset, check, value, meta,
+                          m0, m1, m2, m3)
+
+    def _depth(self, offset):
+        """Return the depth of the record at offset."""
+        depth = _RECORD.unpack_from(self.buf, offset)[2] & 0xffffffff
+        if depth >> 31:
+            depth -= 1 << 32
+        return depth
+
+
+class MoveOrdering:
+
+    """Dynamic move ordering for search.
+
+    Actions are tried in the following order: the best action stored in
+    the transposition table (or given to search as first), the killer
+    actions of the ply, i.e. the last actions which caused a cutoff at
+    this depth, then the other actions by decreasing history score, the
+    score of an action being increased each time it causes a cutoff.
+    Ties keep the order of game.order.
+
+    """
+
+    def __init__(self, killers=2):
+        self.slots = killers
+        self.killers = {}
+        self.history = {}
+
+    def age(self):
+        """Forget the killers and halve the history scores, e.g. before
+        searching a new root state."""
+        self.killers = {}
+        for action in self.history:
+            self.history[action] //= 2
+
+    def order(self, actions, depth, first=None):
+        """Return actions in the order in which to search them at depth."""
+        front = []
+        if first is not None and first in actions:
+            front.append(first)
+        for killer in self.killers.get(depth, ()):
+            if killer != first and killer in actions:
+                front.append(killer)
+        history = self.history
+        rest = [a for a in actions if not a in front]
+        rest.sort(key=lambda a: -history.get(a, 0))
+        return front + rest
+
+    def cutoff(self, action, depth, draft):
+        """Record that action caused a cutoff at depth, draft plies above
+        the leaves of the search."""
+        killers = self.killers.setdefault(depth, [])
+        if not action in killers:
+            killers.insert(0, action)
+            del killers[self.slots:]
+        self.history[action] = self.history.get(action, 0) + max(1, draft) ** 2
+
+
+class SearchStats:
+
+    """Statistics gathered by search.
+
+    Attributes:
+    nodes -- number of states visited, including the evaluated ones
+    evaluations -- number of states evaluated
+    cutoffs -- number of alpha-beta cutoffs
+    first_cutoffs -- number of cutoffs caused by the first action tried
+    depth -- largest depth reached
+
+    """
+
+    def __init__(self):
+        self.nodes = 0
+        self.evaluations = 0
+        self.cutoffs = 0
+        self.first_cutoffs = 0
+        self.depth = 0
+
+    def merge(self, other):
+        """Add the statistics of other, e.g. of another process."""
+        self.nodes += other.nodes
+        self.evaluations += other.evaluations
+        self.cutoffs += other.cutoffs
+        self.first_cutoffs += other.first_cutoffs
+        self.depth = max(self.depth, other.depth)
+
+    def branching_factor(self):
+        """Return the effective branching factor: the branching factor b
+        of the uniform tree of the same depth with as many nodes, i.e.
+        nodes = 1 + b + ... + b ** depth."""
+        if self.depth == 0 or self.nodes <= self.depth + 1:
+            return 1.0
+        low, high = 1.0, float(self.nodes)
+        for _ in range(100):
+            b = (low + high) / 2
+            if sum(b ** i for i in range(self.depth + 1)) < self.nodes:
+                low = b
+            else:
+                high = b
+        return (low + high) / 2
+
+    def __str__(self):
+        return "%d nodes, %d evaluations, %d cutoffs (%d first), " \
+            "depth %d, branching factor %.2f" % \
+            (self.nodes, self.evaluations, self.cutoffs, self.first_cutoffs,
+             self.depth, self.branching_factor())
+
+
+def search(state, game, prune=True, inplace=False, table=None,
+           max_depth=None, deadline=None, first=None, ordering=None,
+           stats=None, pvs=False):
     """Perform a MiniMax/AlphaBeta search and return the best action.
 
     Arguments:
     state -- initial state
     game -- a concrete instance of class Game
     prune -- whether to use AlphaBeta pruning
+    inplace -- whether to expand states with the in-place successor
+        protocol of game (actions, do_action and undo_action) instead
+        of successors
+    table -- a TranspositionTable in which the values of the states
+        searched are stored and looked up by game.key(state), or None.
+        With the in-place protocol, the best action stored for a state
+        is also searched first.
+    max_depth -- if not None, states at this depth are evaluated
+        without calling cutoff
+    deadline -- if not None, a time.perf_counter() value after which
+        the search is aborted by raising SearchTimeout. States modified
+        in place are restored before the exception leaves search.
+    first -- if not None, an action to search first at the root
+    ordering -- a MoveOrdering to sort the actions of each state with,
+        after game.order, or None. It requires the in-place protocol.
+    stats -- a SearchStats to update, or None
+    pvs -- whether to use principal variation search: the first action
+        of a state is searched with the full window and the others with
+        a null window, proving that they are not better, and only
+        searched again with the full window when this fails. It returns
+        the same action as AlphaBeta pruning and requires it.
+
+    The depth stored in the table is the number of plies searched below
+    the state, max_depth - depth. Without max_depth it is minus the
+    depth at which the state was searched: as cutoff is expected to be
+    monotonic in depth, a state met closer to the root has been
+    searched at least as deep. A table can thus be shared by
+    consecutive searches as long as cutoff does not change.
 
     """
+    return _search(state, game, prune, inplace, table, max_depth,
+                   deadline, first, ordering, stats, pvs)[1]
+
+
+def _search(state, game, prune, inplace, table, max_depth, deadline,
+            first, ordering, stats, pvs, alpha=-inf, beta=inf, depth=0):
+    """Implement search with the (alpha, beta) window at the root.
+
+    Return a triplet (value, action, limited) in which limited tells
+    whether some state has been evaluated because of max_depth. If the
+    value is not inside the window, it is only a bound on the value of
+    state. The root is searched as a state at depth, a MAX state if
+    depth is even and a MIN state otherwise.
+
+    """
+    if pvs and not prune:
+        raise ValueError("principal variation search requires pruning")
+    root = depth
+    limited = False
+
+    def successors(state, depth, first=None):
+        if not inplace:
+            if first is None or depth > 0:
+                yield from game.successors(state)
+                return
+            # Only reorder the root, as it builds all the successors
+            children = list(game.successors(state))
+            children.sort(key=lambda child: child[0] != first)
+            yield from children
+            return
+        actions = game.actions(state)
+        if ordering is not None:
+            actions = ordering.order(game.order(state, list(actions)), depth,
+                                     first)
+        elif first is not None:
+            actions = list(actions)
+            if first in actions:
+                actions = [first] + [a for a in actions if a != first]
+        for a in actions:
+            s, record = game.do_action(state, a)
+            try:
+                yield a, s
+            finally:
+                game.undo_action(s, record)
+
+    def draft(depth):
+        if max_depth is None:
+            return -depth
+        return max_depth - depth
+
+    def leaf(state, depth):
+        nonlocal limited
+        if deadline is not None and time.perf_counter() > deadline:
+            raise SearchTimeout()
+        if stats is not None:
+            stats.nodes += 1
+            stats.depth = max(stats.depth, depth)
+        if max_depth is not None and depth >= max_depth:
+            limited = True
+        elif not game.cutoff(state, depth):
+            return False
+        if stats is not None:
+            stats.evaluations += 1
+        return True
+
+    def cut(a, i, depth):
+        """Record the cutoff caused by a, the i-th action tried."""
+        if stats is not None:
+            stats.cutoffs += 1
+            if i == 0:
+                stats.first_cutoffs += 1
+        if ordering is not None:
+            ordering.cutoff(a, depth, draft(depth))
+
+    def probe(state, alpha, beta, depth):
+        """Look state up in the table.
+
+        Return (key, move, alpha, beta, result) in which move is the
+        stored best action, alpha and beta are narrowed by the stored
+        bound and result is the (value, action) pair of state if the
+        entry settles it, None otherwise.
+
+        The root is never settled by the table, only ordered: an entry
+        left by an earlier search would otherwise end the search at
+        once. As the search stored in an entry may have been stopped
+        by its max_depth, a state it settles counts as limited.
+
+        """
+        nonlocal limited
+        key = game.key(state)
+        entry = table.lookup(key)
+        if entry is None:
+            return key, None, alpha, beta, None
+        if entry.depth >= draft(depth) and depth != root:
+            if entry.bound == LOWER:
+                alpha = max(alpha, entry.value)
+            elif entry.bound == UPPER:
+                beta = min(beta, entry.value)
+            if entry.bound == EXACT or (prune and alpha >= beta):
+                if max_depth is not None:
+                    limited = True
+                return key, entry.move, alpha, beta, (entry.value, entry.move)
+        return key, entry.move, alpha, beta, None
+
+    def record(key, val, alpha, beta, depth, action):
+        if val <= alpha:
+            bound = UPPER
+        elif val >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        table.store(key, val, bound, draft(depth), action)
 
     def max_value(state, alpha, beta, depth):
-        if game.cutoff(state, depth):
+        if leaf(state, depth):
             return game.evaluate(state), None
+        hint = first if depth == 0 else None
+        if table is not None:
+            key, move, alpha, beta, result = probe(state, alpha, beta, depth)
+            if result is not None:
+                return result
+            hint = hint or move
+        alpha0 = alpha
         val = -inf
         action = None
-        for a, s in game.successors(state):
-            v, _ = min_value(s, alpha, beta, depth + 1)
-            if v > val:
-                val = v
-                action = a
-                if prune:
-                    if v >= beta:
-                        return v, a
-                    alpha = max(alpha, v)
+        with contextlib.closing(successors(state, depth, hint)) as children:
+            for i, (a, s) in enumerate(children):
+                if pvs and i > 0:
+                    # Null window: does a do better than alpha?
+                    v, _ = min_value(s, alpha, math.nextafter(alpha, inf),
+                                     depth + 1)
+                    if alpha < v < beta:
+                        v, _ = min_value(s, alpha, beta, depth + 1)
+                else:
+                    v, _ = min_value(s, alpha, beta, depth + 1)
+                if v > val:
+                    val = v
+                    action = a
+                    if prune:
+                        if v >= beta:
+                            cut(a, i, depth)
+                            break
+                        alpha = max(alpha, v)
+        if table is not None:
+            record(key, val, alpha0, beta, depth, action)
         return val, action
 
     def min_value(state, alpha, beta, depth):
-        if game.cutoff(state, depth):
+        if leaf(state, depth):
             return game.evaluate(state), None
+        hint = None
+        if table is not None:
+            key, hint, alpha, beta, result = probe(state, alpha, beta, depth)
+            if result is not None:
+                return result
+        beta0 = beta
         val = inf
         action = None
-        for a, s in game.successors(state):
-            v, _ = max_value(s, alpha, beta, depth + 1)
-            if v < val:
-                val = v
-                action = a
-                if prune:
-                    if v <= alpha:
-                        return v, a
-                    beta = min(beta, v)
+        with contextlib.closing(successors(state, depth, hint)) as children:
+            for i, (a, s) in enumerate(children):
+                if pvs and i > 0:
+                    # Null window: does a do worse than beta?
+                    v, _ = max_value(s, math.nextafter(beta, -inf), beta,
+                                     depth + 1)
+                    if alpha < v < beta:
+                        v, _ = max_value(s, alpha, beta, depth + 1)
+                else:
+                    v, _ = max_value(s, alpha, beta, depth + 1)
+                if v < val:
+                    val = v
+                    action = a
+                    if prune:
+                        if v <= alpha:
+                            cut(a, i, depth)
+                            break
+                        beta = min(beta, v)
+        if table is not None:
+            record(key, val, alpha, beta0, depth, action)
         return val, action
 
-    val, action = max_value(state, -inf, inf, 0)
-    return action
+    if depth % 2 == 0:
+        val, action = max_value(state, alpha, beta, depth)
+    else:
+        val, action = min_value(state, alpha, beta, depth)
+    return val, action, limited
+
+
+def _lower_float(value):
+    """Return the largest float not greater than value."""
+    f = float(value)
+    if f > value:
+        f = math.nextafter(f, -inf)
+    return f
+
+
+# State of a ParallelSearch worker process
+_worker = {}
+
+
+def _init_worker(alpha, table):
+    _worker["alpha"] = alpha
+    _worker["generation"] = None
+    _worker["table"] = table if table is not None else TranspositionTable()
+    _worker["ordering"] = MoveOrdering()
+
+
+def _search_child(data, generation, action, prune, inplace, table, max_depth,
+                  budget, submitted, ordering, pvs, beta):
+    """Search the child of the root reached by action in a worker process.
+
+    data is the pickled (game, root) pair. The child is searched with
+    the window (alpha, beta), alpha being the best value found so far
+    by the workers, which is raised if the child does better. alpha is
+    only read before the search: a better value published while the
+    child is searched does not narrow its window.
+
+    budget is the number of seconds left to the search when the child
+    was submitted, at time.time() submitted, or None. The deadline is
+    set on the clock of the worker, as the reference point of
+    time.perf_counter differs between processes; only the time the
+    child waited for a worker is measured on the wall clock.
+
+    Return a triplet (value, exact, limited) in which exact tells
+    whether value is more than a bound, or None if the deadline has
+    passed.
+
+    """
+    deadline = None
+    if budget is not None:
+        waited = max(0.0, time.time() - submitted)
+        deadline = time.perf_counter() + budget - waited
+    if generation != _worker["generation"]:
+        _worker["generation"] = generation
+        _worker["ordering"].age()
+    game, state = pickle.loads(data)
+    if inplace:
+        state, _ = game.do_action(state, action)
+    else:
+        state = next(s for a, s in game.successors(state) if a == action)
+    shared = _worker["alpha"]
+    alpha = shared.value if prune else -inf
+    stats = SearchStats()
+    try:
+        val, _, limited = _search(state, game, prune, inplace,
+                                  _worker["table"] if table else None,
+                                  max_depth, deadline, None,
+                                  _worker["ordering"] if ordering else None,
+                                  stats, pvs, alpha, beta, 1)
+    except SearchTimeout:
+        return None
+    if prune and val > alpha:
+        with shared.get_lock():
+            shared.value = max(shared.value, _lower_float(val))
+    return val, val > alpha, limited, stats
+
+
+class ParallelSearch:
+
+    """Search the actions of the root state in parallel.
+
+    The first action of the root is searched by the calling process, to
+    get a good bound, then the others are searched by a pool of worker
+    processes (young brothers wait). Each one is searched with the best
+    value found so far by any process as alpha. alpha is only shared
+    between the children of the root: it is read when a worker starts
+    on a child, and the window of a child being searched is never
+    narrowed by the values the others find meanwhile, which keeps the
+    bounds of its transposition table entries sound. The game and the
+    root state are pickled once per search and must thus be picklable;
+    the pickled game should not carry the pool.
+
+    The pool persists until close is called, so that consecutive
+    searches do not pay for the start-up of the processes. Each worker
+    keeps its own move ordering across the searches that request a
+    transposition table and move ordering. The workers share table, a
+    SharedTranspositionTable, if given, and otherwise each one has its
+    own TranspositionTable.
+
+    """
+
+    def __init__(self, workers=None, table=None):
+        self.workers = workers or os.cpu_count()
+        self.table = table
+        self.alpha = multiprocessing.Value("d", -inf)
+        self.executor = None
+        self.generation = 0
+
+    def close(self):
+        """Shut the pool of workers down."""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def search(self, state, game, prune=True, inplace=False, table=None,
+               max_depth=None, deadline=None, first=None, ordering=None,
+               stats=None, pvs=False):
+        """Perform a parallel search and return the best action.
+
+        The arguments are those of search. The table and ordering are
+        used by the calling process only, the workers having their own.
+
+        """
+        return self._search(state, game, prune, inplace, table, max_depth,
+                            deadline, first, ordering, stats, pvs)[1]
+
+    def _search(self, state, game, prune, inplace, table, max_depth,
+                deadline, first, ordering, stats, pvs, alpha=-inf,
+                beta=inf):
+        """Implement search as _search does."""
+        if inplace:
+            actions = list(game.actions(state))
+        else:
+            actions = [a for a, s in game.successors(state)]
+        if self.workers < 2 or len(actions) < 2 or game.cutoff(state, 0):
+            return _search(state, game, prune, inplace, table, max_depth,
+                           deadline, first, ordering, stats, pvs, alpha,
+                           beta)
+        if stats is not None:
+            stats.nodes += 1
+        if first is None and table is not None:
+            entry = table.lookup(game.key(state))
+            if entry is not None:
+                first = entry.move
+        if ordering is not None:
+            actions = ordering.order(game.order(state, actions), 0, first)
+        elif first is not None and first in actions:
+            actions = [first] + [a for a in actions if a != first]
+
+        # The eldest brother is searched first, by this process
+        eldest = actions[0]
+        if inplace:
+            child, record = game.do_action(state, eldest)
+            try:
+                val, _, limited = _search(child, game, prune, inplace, table,
+                                          max_depth, deadline, None, ordering,
+                                          stats, pvs, alpha, beta, 1)
+            finally:
+                game.undo_action(child, record)
+        else:
+            child = next(s for a, s in game.successors(state) if a == eldest)
+            val, _, limited = _search(child, game, prune, inplace, table,
+                                      max_depth, deadline, None, ordering,
+                                      stats, pvs, alpha, beta, 1)
+        if prune and val >= beta:
+            return val, eldest, limited
+        exact = val > alpha or not prune
+        if prune:
+            alpha = max(alpha, val)
+
+        if self.executor is None:
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                self.workers, initializer=_init_worker,
+                initargs=(self.alpha, self.table))
+        self.alpha.value = _lower_float(alpha)
+        self.generation += 1
+        data = pickle.dumps((game, state))
+        budget = None
+        if deadline is not None:
+            budget = deadline - time.perf_counter()
+        futures = [self.executor.submit(_search_child, data, self.generation,
+                                        a, prune, inplace, table is not None,
+                                        max_depth, budget, time.time(),
+                                        ordering is not None, pvs, beta)
+                   for a in actions[1:]]
+        results = [(val, exact, limited, None)]
+        timeout = False
+        for future in futures:
+            result = future.result()
+            if result is None:
+                timeout = True
+            else:
+                results.append(result)
+        if timeout:
+            raise SearchTimeout()
+
+        # The best exact value, or the best bound if all failed low
+        best = None
+        for (v, exact, limited, child_stats), a in zip(results, actions):
+            if child_stats is not None and stats is not None:
+                stats.merge(child_stats)
+            if best is None or (exact, v) > best[:2]:
+                best = (exact, v, a)
+        limited = any(result[2] for result in results)
+        return best[1], best[2], limited
+
+
+def move_budget(time_left, step, expected_steps=80, min_moves=10,
+                reserve=0.1):
+    """Return the number of seconds to spend on the action of step.
+
+    The remaining time credit, minus a reserve fraction, is shared
+    evenly between the actions the player is expected to still play:
+    half of the steps left until expected_steps, but at least
+    min_moves. Return None if time_left is None (untimed game).
+
+    """
+    if time_left is None:
+        return None
+    moves_left = max(min_moves, (expected_steps - step) // 2)
+    return max(0.0, time_left * (1.0 - reserve) / moves_left)
+
+
+def iterative_search(state, game, budget=None, max_depth=None, prune=True,
+                     inplace=False, table=None, ordering=None, stats=None,
+                     pvs=False, aspiration=None, parallel=None):
+    """Perform an iterative deepening search and return the best action.
+
+    Search state to depth 1, 2, ... until max_depth is reached, until
+    the search tree is exhausted or until budget seconds have elapsed.
+    The iteration running when the time is up is aborted and the best
+    action of the last completed iteration is returned. Each iteration
+    searches the best action of the previous one first.
+
+    With aspiration windows, each iteration but the first searches the
+    root with the window of half-width aspiration around the value of
+    the previous iteration. When the value falls outside of it, the
+    iteration is searched again with the window open on that side.
+    They only pay off when the values are spread enough for a narrow
+    window to cut moves a full window would not. They do not with the
+    score of basic_agent, a small integer moving by one or two between
+    iterations: on the positions of benchmark.bench_pvs, wide windows
+    evaluate as many states as principal variation search alone and
+    narrower ones more, because of the searches repeated after a fail.
+
+    Arguments:
+    state -- initial state
+    game -- a concrete instance of class Game; its cutoff function should
+        not limit the depth itself
+    budget -- the number of seconds the search may take, or None
+    max_depth -- the maximum depth to search to, or None
+    prune, inplace, table, ordering, stats, pvs -- as for search
+    aspiration -- the half-width of the aspiration windows, or None to
+        search every iteration with the full window. It requires pruning.
+    parallel -- a ParallelSearch to search each iteration with, or None
+
+    """
+    if budget is None and max_depth is None:
+        raise ValueError("iterative_search needs a budget or a max_depth")
+    if aspiration is not None and not prune:
+        raise ValueError("aspiration windows require pruning")
+    deadline = None
+    if budget is not None:
+        deadline = time.perf_counter() + budget
+    root_search = _search if parallel is None else parallel._search
+    best = None
+    val = None
+    depth = 1
+    while max_depth is None or depth <= max_depth:
+        alpha, beta = -inf, inf
+        if aspiration is not None and val is not None:
+            alpha, beta = val - aspiration, val + aspiration
+        try:
+            while True:
+                val, action, limited = root_search(state, game, prune,
+                                                   inplace, table, depth,
+                                                   deadline, best, ordering,
+                                                   stats, pvs, alpha, beta)
+                if val <= alpha and alpha > -inf:
+                    alpha = -inf
+                elif val >= beta and beta < inf:
+                    beta = inf
+                else:
+                    break
+        except SearchTimeout:
+            break
+        best = action
+        if not limited:
+            break
+        depth += 1
+    if best is None:
+        # Not even the first iteration completed
+        if inplace:
+            best = next(iter(game.actions(state)))
+        else:
+            best = next(iter(game.successors(state)))[0]
+    return best
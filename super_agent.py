@@ -21,6 +21,7 @@ along with this program; if not, see <http://www.gnu.org/licenses/>.
 
 import zombies
 import minimax
+import book
 import random
 import math 
 
@@ -30,11 +31,28 @@ DEFENSE = 1
 class Agent: #(Agent, minimax.Game):
     """This is the skeleton of an agent to play the Zombies game."""
 
-    def __init__(self, name="Super Agent"):
+    def __init__(self, name="Super Agent", workers=None, book_path=None):
         self.name = name
         self.player = zombies.PLAYER1
         self.strategy = ATTACK
         self.positions = {}
+        self.table = minimax.TranspositionTable()
+        self.max_depth = 2
+        self.ordering = minimax.MoveOrdering()
+        self.parallel = None
+        if workers is not None:
+            self.parallel = minimax.ParallelSearch(workers)
+        self.book = book.open_book(book_path)
+
+    """The search caches and the worker pool stay in this process when
+    the agent is pickled to be sent to the workers of a parallel search:
+    the copy is only used as the game of the search.
+    """
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["table"] = state["ordering"] = state["parallel"] = None
+        state["book"] = None
+        return state
 
     """The successors function must return (or yield) a list of
     pairs (a, s) in which a is the action played to reach the
@@ -61,22 +79,65 @@ class Agent: #(Agent, minimax.Game):
             random.shuffle(actions)
             for a in actions:
                 newboard = board.clone()
-                newboard.play_action(a, player, step)
+                newboard.apply_trusted(a, player, step)
                 yield (a, (newboard, -player, step + 1))
 
 
         else : 
-            actions = board.get_actions(player, step)
+            actions = board.iter_actions(player, step)
             for a in actions:
                 newboard = board.clone()
-                newboard.play_action(a, player, step)
+                newboard.apply_trusted(a, player, step)
                 yield (a, (newboard, -player, step + 1))
 
+    """The actions, do_action and undo_action functions implement
+    the in-place successor protocol of minimax.search: actions are
+    played on the board of the state and taken back afterwards
+    instead of cloning the board for every successor.
+    """
+    def actions(self, state):
+        board, player, step = state
+        if player == self.player :
+            actions = board.get_actions(player, step)
+            random.shuffle(actions)
+            return actions
+        return board.iter_actions(player, step)
+
+    def do_action(self, state, action):
+        board, player, step = state
+        record = board.do_action(action, player, step, trusted=True)
+        return (board, -player, step + 1), record
+
+    def undo_action(self, state, record):
+        state[0].undo(record)
+
+    """The order function sorts the actions before the search tries
+    them: the actions bringing a piece next to the necromancer of the
+    opponent come first.
+    """
+    def order(self, state, actions):
+        board, player, step = state
+        pos = board.necromancer_pos(-player)
+        if pos is None:
+            return actions
+        near = set(board.get_neighbouring_tiles(pos))
+        return sorted(actions, key=lambda a: not a[2] in near)
+
+    """The key function identifies a state in the transposition table:
+    the board hash covers the pieces and the player to play, and steps
+    after the placement phase all follow the same rules.
+    """
+    def key(self, state):
+        board, player, step = state
+        return (board.position_hash, min(step, 9))
+
     """The cutoff function returns true if the alpha-beta/minimax
-    search has to stop; false otherwise.
+    search has to stop; false otherwise. The depth is not limited
+    when max_depth is None, iterative deepening then limits it.
     """
     def cutoff(self, state, depth):
-        if depth >= 2 or state[0].is_finished():
+        if (self.max_depth is not None and depth >= self.max_depth) or \
+                state[0].is_finished():
             return True
 
         return False
@@ -98,10 +159,10 @@ class Agent: #(Agent, minimax.Game):
         self.update_necromancer(b)
         
         if self.positions[self.player * zombies.NECROMANCER] :
-            circleMyNecro = len(b.get_non_empty_neighbours(self.positions[self.player * zombies.NECROMANCER][0]))
+            circleMyNecro = b.occupied_degree(self.positions[self.player * zombies.NECROMANCER][0])
         
         if self.positions[-self.player * zombies.NECROMANCER] :
-            circleHisNecro = len(b.get_non_empty_neighbours(self.positions[-self.player * zombies.NECROMANCER][0]))
+            circleHisNecro = b.occupied_degree(self.positions[-self.player * zombies.NECROMANCER][0])
             hisFreeNecro = len(b.get_necromancer_moves(self.positions[-self.player * zombies.NECROMANCER][0]))
          
         """if self.strategy == DEFENSE:
@@ -146,6 +207,10 @@ class Agent: #(Agent, minimax.Game):
         
 
     def play(self, board, player, step, time_left):
+        if self.book is not None:
+            action = self.book.choose(board, step)
+            if action is not None:
+                return action
         self.player = player
         self.time_left = time_left
         
@@ -154,13 +219,27 @@ class Agent: #(Agent, minimax.Game):
         else:
             self.strategy = ATTACK
 
-        state = (board, player, step)
-        return minimax.search(state, self)
+        state = (board.clone(), player, step)
+        self.ordering.age()
+        if time_left is None:
+            self.max_depth = 2
+            if self.parallel is not None:
+                return self.parallel.search(state, self, inplace=True,
+                                            table=self.table,
+                                            ordering=self.ordering)
+            return minimax.search(state, self, inplace=True, table=self.table,
+                                  ordering=self.ordering)
+        self.max_depth = None
+        budget = minimax.move_budget(time_left, step)
+        return minimax.iterative_search(state, self, budget, inplace=True,
+                                        table=self.table,
+                                        ordering=self.ordering,
+                                        parallel=self.parallel)
 
     def is_necromancer_in_danger(self, board):
         self.update_necromancer(board)
-        myNecro = len(board.get_non_empty_neighbours(self.positions[self.player * zombies.NECROMANCER][0]))
-        hisNecro = len(board.get_non_empty_neighbours(self.positions[-self.player * zombies.NECROMANCER][0]))
+        myNecro = board.occupied_degree(self.positions[self.player * zombies.NECROMANCER][0])
+        hisNecro = board.occupied_degree(self.positions[-self.player * zombies.NECROMANCER][0])
 
         if myNecro > 4 and hisNecro < 5:
             return True
@@ -178,15 +257,9 @@ class Agent: #(Agent, minimax.Game):
 
         if not changed: return"""
         self.positions = {}
-        
-        for pos in board.pieces:
-            for kind in range(1,5):
-                self.positions.setdefault(kind, [])
-                self.positions.setdefault(-kind, [])
-                if self.check_tile(board, pos, self.player * kind):
-                    self.positions[kind * self.player].append(pos)
-                elif self.check_tile(board, pos, -self.player * kind):
-                    self.positions[kind * -self.player].append(pos)
+        for kind in range(1,5):
+            self.positions[kind] = list(board.locate(kind))
+            self.positions[-kind] = list(board.locate(-kind))
         
 
     def check_tile(self, board, pos, piece):
@@ -0,0 +1,409 @@
+"""
+Tests of the searches and of the shared-memory transposition table of
+minimax, and of the board backends they search on.
+Copyright (C) 2014, Université catholique de Louvain
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; version 2 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+Run with: python -m unittest test_minimax
+
+"""
+
+import marshal
+import multiprocessing
+import pickle
+import random
+import time
+import unittest
+
+import basic_agent
+import benchmark
+import minimax
+from zombies import BACKENDS, Board, PLAYER1
+
+
+def snapshot(board):
+    """Return the pieces, unplaced pieces and hash of board."""
+    return (dict(board.pieces), dict(board.unplaced_pieces),
+            board.position_hash)
+
+
+class BoardTest(unittest.TestCase):
+
+    def check_hash(self, board):
+        self.assertEqual(board.compute_hash(), board.position_hash)
+
+    def play_game(self, seed, backend):
+        """Play a random game on a board of backend and on a dict Board,
+        checking the board of backend after every action."""
+        rnd = random.Random(seed)
+        reference = Board()
+        board = Board(backend=backend)
+        player = PLAYER1
+        # The boards left behind, with their position and actions
+        history = []
+        for step in range(1, 80):
+            if reference.is_finished():
+                break
+            actions = sorted(reference.get_actions(player, step))
+            self.assertEqual(sorted(board.get_actions(player, step)), actions)
+            action = rnd.choice(actions)
+            before = snapshot(board)
+            record = board.do_action(action, player, step)
+            self.check_hash(board)
+            after = snapshot(board)
+            # A nested action, taken back before the first one
+            replies = board.get_actions(-player, step + 1)
+            if replies and not board.is_finished():
+                nested = board.do_action(rnd.choice(replies), -player,
+                                         step + 1, trusted=True)
+                self.check_hash(board)
+                board.undo(nested)
+                self.assertEqual(snapshot(board), after)
+            board.undo(record)
+            self.assertEqual(snapshot(board), before)
+            self.check_hash(board)
+            # The game goes on on a clone, which must not share its
+            # changes with the board
+            parent = board
+            board = parent.clone()
+            board.play_action(action, player, step)
+            reference.play_action(action, player, step)
+            self.check_hash(board)
+            history.append((parent, before, player, step, actions))
+            self.assertEqual(snapshot(board), snapshot(reference))
+            self.assertEqual(board.is_finished(), reference.is_finished())
+            if step % 10 == 0:
+                for copy in (Board.from_bytes(board.to_bytes(), backend),
+                             pickle.loads(pickle.dumps(board))):
+                    self.assertIs(type(copy), type(board))
+                    self.assertEqual(snapshot(copy), snapshot(board))
+                    self.check_hash(copy)
+            player = -player
+        for parent, before, player, step, actions in history:
+            self.assertEqual(snapshot(parent), before)
+            self.assertEqual(sorted(parent.get_actions(player, step)),
+                             actions)
+
+    def test_backends(self):
+        for backend in sorted(BACKENDS):
+            for seed in range(10):
+                with self.subTest(backend=backend, seed=seed):
+                    self.play_game(seed, backend)
+
+
+class TieBreakingAgent(basic_agent.Agent):
+    """Basic agent whose evaluations differ between positions: the
+    score is followed by a fraction drawn from the position hash, so
+    that the best action of a search is unique."""
+
+    def evaluate(self, state):
+        board = state[0]
+        return board.get_score(self.player) + board.position_hash / 2.0 ** 65
+
+
+class SearchTest(unittest.TestCase):
+
+    def test_pvs_and_aspiration_find_alphabeta_actions(self):
+        agent = TieBreakingAgent()
+        agent.max_depth = None
+        positions = benchmark.random_positions(12, 60, seed=1)
+        searched = 0
+        for board, player, step in positions:
+            if board.is_finished():
+                continue
+            agent.player = player
+
+            def state():
+                return Board(board, backend="compact"), player, step
+
+            reference = minimax.search(state(), agent, inplace=True,
+                                       max_depth=2)
+            self.assertIsNotNone(reference)
+            self.assertEqual(minimax.search(state(), agent, inplace=True,
+                                            max_depth=2, pvs=True),
+                             reference)
+            for table, ordering in ((None, None),
+                                    (minimax.TranspositionTable(),
+                                     minimax.MoveOrdering())):
+                self.assertEqual(minimax.iterative_search(
+                    state(), agent, max_depth=2, inplace=True, table=table,
+                    ordering=ordering, pvs=True, aspiration=0.25), reference)
+            searched += 1
+        self.assertTrue(searched >= 10)
+
+    def test_deepening_with_a_table_kept_between_searches(self):
+        game = Nim()
+        with minimax.ParallelSearch(2) as parallel:
+            for search in (None, parallel):
+                table = minimax.TranspositionTable()
+                state = ([3, 4, 5], 1)
+                action = minimax.iterative_search(state, game, max_depth=3,
+                                                  table=table, inplace=True,
+                                                  parallel=search)
+                # The position two plies down the principal variation,
+                # which the table holds from the first search
+                child, _ = game.do_action(state, action)
+                reply = table.lookup(game.key(child)).move
+                state, _ = game.do_action(child, reply)
+                self.assertIsNotNone(table.lookup(game.key(state)))
+                stats = minimax.SearchStats()
+                action = minimax.iterative_search(state, game, max_depth=3,
+                                                  table=table, inplace=True,
+                                                  stats=stats,
+                                                  parallel=search)
+                self.assertEqual(stats.depth, 3)
+                expected = minimax.iterative_search(
+                    (list(state[0]), state[1]), game, max_depth=3,
+                    inplace=True, table=minimax.TranspositionTable())
+                self.assertEqual(value(Nim(3), state, action),
+                                 value(Nim(3), state, expected))
+
+
+class Nim(minimax.Game):
+
+    """Nim, the player taking the last object winning. A state is a
+    pair ([heaps], player), the heaps being changed in place by
+    do_action; successors builds new states. A state is evaluated by
+    the player to play and the nim-sum of the heaps."""
+
+    def __init__(self, max_depth=None):
+        self.max_depth = max_depth
+
+    def actions(self, state):
+        heaps, player = state
+        return [(i, n) for i, heap in enumerate(heaps)
+                for n in range(1, heap + 1)]
+
+    def do_action(self, state, action):
+        heaps, player = state
+        i, n = action
+        heaps[i] -= n
+        return (heaps, -player), (i, n)
+
+    def undo_action(self, state, record):
+        i, n = record
+        state[0][i] += n
+
+    def successors(self, state):
+        heaps, player = state
+        for i, n in self.actions(state):
+            child = list(heaps)
+            child[i] -= n
+            yield (i, n), (child, -player)
+
+    def key(self, state):
+        return tuple(state[0]), state[1]
+
+    def cutoff(self, state, depth):
+        return not any(state[0]) or \
+            (self.max_depth is not None and depth >= self.max_depth)
+
+    def evaluate(self, state):
+        heaps, player = state
+        nim_sum = 0
+        for heap in heaps:
+            nim_sum ^= heap
+        # The player to play loses when the nim-sum is 0
+        won = nim_sum != 0
+        return (sum(heaps) + 1) * player * (1 if won else -1)
+
+
+def value(game, state, action):
+    """Return the minimax value of the action of MAX in state."""
+    child = next(s for a, s in game.successors(state) if a == action)
+    return minimax._search(child, game, True, False, None, None,
+                           None, None, None, None, False, depth=1)[0]
+
+
+class ParallelSearchTest(unittest.TestCase):
+
+    def test_same_value_as_search(self):
+        with minimax.ParallelSearch(2) as parallel:
+            for max_depth in (None, 2):
+                game = Nim(max_depth)
+                for heaps in ([1, 2, 3], [2, 3, 4], [1, 4, 4], [3, 3, 5]):
+                    state = (heaps, 1)
+                    expected = value(game, state,
+                                          minimax.search(state, game))
+                    for inplace in (False, True):
+                        action = parallel.search(
+                            (list(heaps), 1), game, inplace=inplace,
+                            table=minimax.TranspositionTable(),
+                            ordering=minimax.MoveOrdering()
+                            if inplace else None)
+                        self.assertEqual(value(game, state, action),
+                                         expected, (heaps, inplace))
+
+    def test_deadline(self):
+        game = Nim()
+        with minimax.ParallelSearch(2) as parallel:
+            for inplace in (False, True):
+                heaps = [3, 4, 5]
+                with self.assertRaises(minimax.SearchTimeout):
+                    parallel.search((heaps, 1), game, inplace=inplace,
+                                    deadline=time.perf_counter() - 1)
+                self.assertEqual(heaps, [3, 4, 5])
+                # The eldest child, searched first, is small: the
+                # workers run out of time on the others
+                with self.assertRaises(minimax.SearchTimeout):
+                    parallel.search((heaps, 1), game, prune=False,
+                                    inplace=inplace, first=(2, 5),
+                                    deadline=time.perf_counter() + 0.2)
+                self.assertEqual(heaps, [3, 4, 5])
+                # A deadline far enough is met by the workers
+                state = (heaps, 1)
+                action = parallel.search(state, game, inplace=inplace,
+                                         deadline=time.perf_counter() + 60)
+                self.assertEqual(value(game, state, action),
+                                 value(game, state, minimax.search(state,
+                                                                   game)))
+
+    def test_worker_deadline(self):
+        # The worker sets its deadline from the budget left, less the
+        # time the child waited for it, whatever its own clock reads
+        minimax._init_worker(multiprocessing.Value("d", -minimax.inf), None)
+        game = Nim()
+        data = pickle.dumps((game, ([3, 4, 5], 1)))
+
+        def search_child(budget, submitted):
+            return minimax._search_child(data, 1, (2, 5), False, False,
+                                         False, None, budget, submitted,
+                                         False, False, minimax.inf)
+
+        self.assertIsNone(search_child(-1, time.time()))
+        self.assertIsNone(search_child(60, time.time() - 61))
+        self.assertIsNotNone(search_child(60, time.time()))
+        self.assertIsNotNone(search_child(None, None))
+
+
+# The keys stored by all the writers, so that they overwrite each
+# other's records, and those stored with a move too long to be kept
+KEYS = [(0, k) for k in range(96)]
+LONG_KEYS = [(1, k) for k in range(32)]
+
+
+def expected(key, value):
+    """Return the (bound, depth, move) stored with value for key: the
+    whole record follows from the key and the value, so that a record
+    mixing the words of two writers is detected."""
+    move = ('M', (value % 97, key[1]), (value % 89, value // 1000))
+    if key[0] == 1:
+        # Marshalled, this move does not fit in a record
+        move = ('M', tuple(range(value % 5, value % 5 + 12)), (key[1], 0))
+    return value % 3, value % 50 - 10, move
+
+
+def check(table, key):
+    """Probe key in table and return a description of what is wrong
+    with the entry found, or None if it is a miss or a record stored
+    by store."""
+    entry = table.lookup(key)
+    if entry is None:
+        return None
+    bound, depth, move = expected(key, entry.value)
+    if key[0] == 1:
+        move = None
+    if entry.key != key or (entry.bound, entry.depth, entry.move) != \
+            (bound, depth, move):
+        return "%r: %r" % (key, entry)
+    return None
+
+
+def store(table, key, value):
+    """Store the record of value for key in table."""
+    bound, depth, move = expected(key, value)
+    table.store(key, value, bound, depth, move)
+
+
+def writer(table, writer_id, operations, queue):
+    """Store and probe random keys of table, sending back the errors
+    found."""
+    rnd = random.Random(writer_id)
+    errors = []
+    try:
+        for n in range(operations):
+            keys = LONG_KEYS if n % 8 == 0 else KEYS
+            key = rnd.choice(keys)
+            if rnd.random() < 0.6:
+                store(table, key, writer_id * 1000000 + n)
+            else:
+                error = check(table, key)
+                if error is not None:
+                    errors.append(error)
+    except Exception as e:
+        errors.append(repr(e))
+    # The table is left open: forked writers share the object of the
+    # process which created it, and closing it would destroy the block
+    queue.put((writer_id, errors, table.hits))
+
+
+class SharedTranspositionTableTest(unittest.TestCase):
+
+    def run_writers(self, method, writers, operations):
+        """Run writers processes started with method on one small table
+        and check their probes and the final records."""
+        context = multiprocessing.get_context(method)
+        with minimax.SharedTranspositionTable(16) as table:
+            queue = context.Queue()
+            processes = [context.Process(target=writer,
+                                         args=(table, i, operations, queue))
+                         for i in range(writers)]
+            for process in processes:
+                process.start()
+            results = [queue.get(timeout=120) for _ in processes]
+            for process in processes:
+                process.join()
+                self.assertEqual(process.exitcode, 0)
+            for writer_id, errors, hits in results:
+                self.assertEqual(errors, [], "writer %d" % writer_id)
+            # Several writers found records stored by the others
+            self.assertTrue(sum(hits for _, _, hits in results) > 0)
+            for key in KEYS + LONG_KEYS:
+                self.assertIsNone(check(table, key))
+
+    def test_concurrent_writers_fork(self):
+        if "fork" not in multiprocessing.get_all_start_methods():
+            self.skipTest("fork is not available")
+        self.run_writers("fork", 4, 50000)
+
+    def test_concurrent_writers_spawn(self):
+        self.run_writers("spawn", 2, 5000)
+
+    def test_round_trip(self):
+        with minimax.SharedTranspositionTable(1024) as table:
+            for key in KEYS:
+                store(table, key, key[1] * 7)
+            for value in (-(1 << 63), (1 << 63) - 1, 1 << 70, -2.5):
+                table.store((2, 0), value, 1, 3, None)
+                self.assertEqual(table.lookup((2, 0)).value, value)
+            for key in KEYS:
+                entry = table.lookup(key)
+                self.assertIsNotNone(entry)
+                self.assertEqual((entry.value, entry.bound, entry.depth,
+                                  entry.move),
+                                 (key[1] * 7,) + expected(key, key[1] * 7))
+
+    def test_long_moves_are_dropped(self):
+        with minimax.SharedTranspositionTable(1024) as table:
+            key = LONG_KEYS[0]
+            bound, depth, move = expected(key, 12)
+            self.assertTrue(len(marshal.dumps(move)) > minimax._MOVE_SIZE)
+            table.store(key, 12, bound, depth, move)
+            entry = table.lookup(key)
+            self.assertEqual((entry.value, entry.bound, entry.depth,
+                              entry.move), (12, bound, depth, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
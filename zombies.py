@@ -20,6 +20,13 @@ along with this program; if not, see <http://www.gnu.org/licenses/>.
 import random
 import itertools
 import operator
+import array
+import collections
+import collections.abc
+import os
+import struct
+import sys
+import types
 
 PLAYER1 = 1
 PLAYER2 = -1
@@ -38,6 +45,249 @@ SPRINTER = 5
 
 PIECE_NAMES = ["EMPTY", "NECROMANCER", "HUGGER", "JUMPER", "CREEPER", "SPRINTER"]
 
+# Debug mode: cross-check every trusted action with the strict path
+CHECK_TRUSTED = bool(os.environ.get("ZOMBIES_CHECK_TRUSTED"))
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(x):
+  """Returns the splitmix64 scrambling of the 64-bit integer x"""
+  x = (x + 0x9E3779B97F4A7C15) & _MASK64
+  x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+  x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+  return x ^ (x >> 31)
+
+# Zobrist keys are derived from the features they stand for rather than
+# drawn at random, so that hashes agree between processes and backends.
+_ZOBRIST_TILE_KEYS = {}
+_ZOBRIST_SIDE = _mix64(1 << 57)
+
+
+def _zobrist_tile(pos, level, piece):
+  """Returns the Zobrist key of piece lying at the given stack level
+  (0 for the bottom of the stack) of the tile at pos"""
+  key = _ZOBRIST_TILE_KEYS.get((pos, level, piece))
+  if key is None:
+    q, r = pos
+    key = _mix64(((q & 0xffff) << 32) | ((r & 0xffff) << 16) | (level << 8) | (piece & 0xff))
+    _ZOBRIST_TILE_KEYS[(pos, level, piece)] = key
+  return key
+
+
+def _zobrist_unplaced(piece, qty):
+  """Returns the Zobrist key of player piece having qty unplaced copies"""
+  return _mix64((1 << 56) | ((piece & 0xff) << 8) | qty)
+
+
+def _zobrist_value(pos, value):
+  """Returns the Zobrist hash of a tile of Board.pieces"""
+  if type(value) is list:
+    key = 0
+    for level in range(len(value)):
+      key ^= _zobrist_tile(pos, level, value[level])
+    return key
+  return _zobrist_tile(pos, 0, value)
+
+
+# Axial offsets of the six neighbours of a tile; the index of an offset
+# is its direction
+_NEIGHBOUR_DELTAS = ((1, 0), (1, -1), (0, -1), (-1, 0), (-1, 1), (0, 1))
+_DIRECTIONS = {delta: d for d, delta in enumerate(_NEIGHBOUR_DELTAS)}
+# For each direction d, the directions of the two tiles flanking a move
+# towards the neighbour in direction d: the move respects the move
+# liberty unless both are occupied
+_GATES = tuple(((d + 1) % 6, (d - 1) % 6) for d in range(6))
+_NEIGHBOURS = {}
+
+
+def _neighbours(pos):
+  """Returns the tuple of the six positions adjacent to pos, indexed by
+  direction. It is built once per position and shared between calls."""
+  tiles = _NEIGHBOURS.get(pos)
+  if tiles is None:
+    q, r = pos
+    tiles = _NEIGHBOURS[pos] = tuple((q + delta_q, r + delta_r)
+      for delta_q, delta_r in _NEIGHBOUR_DELTAS)
+  return tiles
+
+
+# Version of the encoding of Board.to_bytes
+_ENCODING = 2
+# Header of the encoding: version, side to move, origin, number of
+# tiles, number of hugger stacks and unplaced pieces, in the order of
+# _ENCODED_PIECES. It is followed by the tiles, sorted by position: the
+# offsets of their q from the origin, then those of their r, then their
+# top pieces, one signed byte each, and then by the stacks, as the
+# offsets of their position, their number of buried pieces and these
+# pieces, bottom first. The origin is (0, 0), or the smallest q and r
+# of the tiles when a coordinate does not fit in a byte.
+_HEADER = struct.Struct("<BbhhHB10B")
+_STACK = struct.Struct("<bbB")
+_ENCODED_PIECES = (NECROMANCER, HUGGER, JUMPER, CREEPER, SPRINTER,
+  -NECROMANCER, -HUGGER, -JUMPER, -CREEPER, -SPRINTER)
+_ENCODED_ZEROS = (0,) * len(_ENCODED_PIECES)
+
+
+class _TileKeys(dict):
+  """Cache of the sort keys of the positions for _encode_position. The
+  key of (q, r) is (q + 128) << 16 | (r + 128) << 8 | 128: adding the
+  top piece of the tile to it gives an int ordered as the position,
+  whose three low bytes are the signed bytes of q, r and the piece with
+  their sign bit flipped. Positions with a coordinate which does not
+  fit in a byte get a key beyond these three bytes."""
+
+  def __missing__(self, pos):
+    q, r = pos
+    if -128 <= q < 128 and -128 <= r < 128:
+      key = ((q + 128) << 16) + ((r + 128) << 8) + 128
+    else:
+      key = 1 << 24
+    self[pos] = key
+    return key
+
+_TILE_KEYS = _TileKeys()
+# Flips the sign bit of each byte
+_SIGN_FLIP = bytes(i ^ 0x80 for i in range(256))
+# The offsets of the bytes of q, r and the piece in the sort keys
+# stored in an array.array('I')
+_KEY_SIZE = array.array('I').itemsize
+_KEY_BYTES = (2, 1, 0) if sys.byteorder == "little" else \
+  (_KEY_SIZE - 3, _KEY_SIZE - 2, _KEY_SIZE - 1)
+
+
+def _encode_position(side_to_move, unplaced_pieces, tops, buried):
+  """Returns the encoding of Board.to_bytes of the position given by
+  side_to_move, unplaced_pieces, the top piece of each tile tops and
+  the pieces under the top of each hugger stack buried"""
+  origin_q = origin_r = 0
+  # The tiles are sorted and split into bytes through their sort keys
+  keys = sorted(map(operator.add, map(_TILE_KEYS.__getitem__, tops), tops.values()))
+  if keys and keys[-1] >= 1 << 24:
+    origin_q = min([q for q, r in tops])
+    origin_r = min([r for q, r in tops])
+    tops = {(q - origin_q, r - origin_r): top for (q, r), top in tops.items()}
+    buried = {(q - origin_q, r - origin_r): below for (q, r), below in buried.items()}
+    keys = sorted(map(operator.add, map(_TILE_KEYS.__getitem__, tops), tops.values()))
+    if keys[-1] >= 1 << 24:
+      raise ValueError("board too large to encode")
+  return _encode_keys(side_to_move,
+    map(unplaced_pieces.get, _ENCODED_PIECES, _ENCODED_ZEROS),
+    origin_q, origin_r, keys, buried)
+
+
+def _encode_keys(side_to_move, unplaced, origin_q, origin_r, keys, buried):
+  """Returns the encoding of Board.to_bytes of the position given by
+  side_to_move, the unplaced pieces in the order of _ENCODED_PIECES,
+  the origin, the sorted keys of _TileKeys of the tiles, relative to
+  the origin, plus their top pieces, and the pieces under the top of
+  each hugger stack buried, also relative to the origin"""
+  data = array.array('I', keys).tobytes()
+  q_byte, r_byte, top_byte = _KEY_BYTES
+  parts = [_HEADER.pack(_ENCODING, side_to_move, origin_q, origin_r,
+      len(keys), len(buried), *unplaced),
+    data[q_byte::_KEY_SIZE].translate(_SIGN_FLIP),
+    data[r_byte::_KEY_SIZE].translate(_SIGN_FLIP),
+    data[top_byte::_KEY_SIZE].translate(_SIGN_FLIP)]
+  for pos in sorted(buried):
+    below = buried[pos]
+    parts.append(_STACK.pack(pos[0], pos[1], len(below)))
+    parts.append(array.array('b', below).tobytes())
+  return b"".join(parts)
+
+
+def _decode_tiles(data):
+  """Returns (side_to_move, unplaced, q_coords, r_coords, pieces,
+  stacks) for the position encoded in data by Board.to_bytes: the
+  unplaced pieces in the order of _ENCODED_PIECES, the coordinates and
+  top pieces of the tiles, in the same order, and a list of the
+  (position, pieces under the top) pairs of the hugger stacks"""
+  if len(data) < _HEADER.size:
+    raise ValueError("invalid board encoding")
+  fields = _HEADER.unpack_from(data)
+  if fields[0] != _ENCODING:
+    raise ValueError("unknown board encoding: " + str(fields[0]))
+  side_to_move, origin_q, origin_r, count, stack_count = fields[1:6]
+  start = _HEADER.size
+  end = start + 3 * count
+  if end > len(data):
+    raise ValueError("invalid board encoding")
+  q_coords = array.array('b', data[start:start + count])
+  r_coords = array.array('b', data[start + count:start + 2 * count])
+  pieces = array.array('b', data[start + 2 * count:end])
+  if origin_q or origin_r:
+    q_coords = list(map(origin_q.__add__, q_coords))
+    r_coords = list(map(origin_r.__add__, r_coords))
+  stacks = []
+  for _ in range(stack_count):
+    if end + _STACK.size > len(data):
+      raise ValueError("invalid board encoding")
+    q, r, depth = _STACK.unpack_from(data, end)
+    end += _STACK.size
+    stacks.append(((q + origin_q, r + origin_r), array.array('b', data[end:end + depth]).tolist()))
+    end += depth
+  if end != len(data):
+    raise ValueError("invalid board encoding")
+  return side_to_move, fields[6:], q_coords, r_coords, pieces, stacks
+
+
+def _decode_position(data):
+  """Returns (side_to_move, unplaced_pieces, tops, buried), the position
+  encoded in data by Board.to_bytes: tops gives the top piece of each
+  tile and buried the pieces under the top of each hugger stack"""
+  side_to_move, unplaced, q_coords, r_coords, pieces, stacks = _decode_tiles(data)
+  tops = dict(zip(zip(q_coords, r_coords), pieces))
+  buried = dict(stacks)
+  if len(tops) != len(pieces) or len(buried) != len(stacks):
+    raise ValueError("invalid board encoding")
+  return side_to_move, dict(zip(_ENCODED_PIECES, unplaced)), tops, buried
+
+
+def _articulation_points(nodes, neighbours):
+  """Returns (points, groups) for the graph of nodes in which the
+  neighbours of a node are those of neighbours(node) which are in
+  nodes: points is the set of its articulation points, the nodes
+  whose removal disconnects their group of connected nodes, and groups
+  is the number of such groups.
+
+  This is Tarjan's algorithm, with an explicit stack.
+
+  """
+  points = set()
+  groups = 0
+  depth = {}
+  low = {}
+  for root in nodes:
+    if root in depth:
+      continue
+    groups += 1
+    depth[root] = low[root] = 0
+    root_children = 0
+    stack = [(root, None, iter(neighbours(root)))]
+    while stack:
+      node, parent, children = stack[-1]
+      for child in children:
+        if not child in nodes:
+          continue
+        if not child in depth:
+          depth[child] = low[child] = depth[node] + 1
+          stack.append((child, node, iter(neighbours(child))))
+          break
+        elif child != parent and depth[child] < low[node]:
+          low[node] = depth[child]
+      else:
+        stack.pop()
+        if parent is not None:
+          if low[node] < low[parent]:
+            low[parent] = low[node]
+          if parent == root:
+            root_children += 1
+          elif low[node] >= depth[parent]:
+            points.add(parent)
+    if root_children > 1:
+      points.add(root)
+  return points, groups
+
 
 class InvalidAction(Exception):
 
@@ -65,33 +315,192 @@ class NoPath(Exception):
         between these two positions"
 
 
+class Symmetry:
+  """
+  Symmetry of the hex grid: a reflection across the q = r axis if
+  mirror, followed by rotation turns of 60 degrees and by the
+  translation by offset. It maps (q, r) to
+  (a * q + b * r + offset[0], c * q + d * r + offset[1]),
+  matrix being (a, b, c, d).
+
+  Board.canonical_key returns the symmetry mapping a board to its
+  canonical position; map_action and unmap_action convert the actions
+  between the two.
+
+  """
+
+  def __init__(self, mirror=False, rotation=0, offset=(0, 0)):
+    self.mirror = mirror
+    self.rotation = rotation % 6
+    self.offset = offset
+    a, b, c, d = (0, 1, 1, 0) if mirror else (1, 0, 0, 1)
+    for _ in range(self.rotation):
+      # A turn maps (q, r) to (-r, q + r)
+      a, b, c, d = -c, -d, a + c, b + d
+    self.matrix = (a, b, c, d)
+
+  def __repr__(self):
+    return "Symmetry(%r, %d, %r)" % (self.mirror, self.rotation, self.offset)
+
+  def apply(self, pos):
+    """Returns the image of pos"""
+    a, b, c, d = self.matrix
+    q, r = pos
+    return (a * q + b * r + self.offset[0], c * q + d * r + self.offset[1])
+
+  def invert(self, pos):
+    """Returns the position whose image is pos"""
+    a, b, c, d = self.matrix
+    q = pos[0] - self.offset[0]
+    r = pos[1] - self.offset[1]
+    # The determinant is 1 or -1
+    det = a * d - b * c
+    return ((d * q - b * r) * det, (a * r - c * q) * det)
+
+  def map_action(self, action):
+    """Returns the image of action: the same action, with the tiles
+    mapped by apply"""
+    kind, first, second = action
+    if kind == 'P':
+      return (kind, first, self.apply(second))
+    if kind == 'M':
+      return (kind, self.apply(first), self.apply(second))
+    return action
+
+  def unmap_action(self, action):
+    """Returns the action whose image is action"""
+    kind, first, second = action
+    if kind == 'P':
+      return (kind, first, self.invert(second))
+    if kind == 'M':
+      return (kind, self.invert(first), self.invert(second))
+    return action
+
+
+# The 12 symmetries of the grid fixing (0, 0)
+_SYMMETRIES = tuple(Symmetry(mirror, rotation)
+  for mirror in (False, True) for rotation in range(6))
+
+
+class _PiecesView(collections.abc.Mapping):
+  """Read-only mapping from each position of a Board to its piece,
+  EMPTY, or the list of the pieces of its hugger stack, bottom first,
+  built from the top pieces and the buried pieces of the board."""
+
+  __slots__ = ("_tops", "_buried")
+
+  def __init__(self, tops, buried):
+    self._tops = tops
+    self._buried = buried
+
+  def __getitem__(self, pos):
+    top = self._tops[pos]
+    buried = self._buried.get(pos)
+    if buried is None:
+      return top
+    return buried + [top]
+
+  def __contains__(self, pos):
+    return pos in self._tops
+
+  def __iter__(self):
+    return iter(self._tops)
+
+  def __len__(self):
+    return len(self._tops)
+
+  def items(self):
+    if not self._buried:
+      return self._tops.items()
+    return collections.abc.ItemsView(self)
+
+  def __repr__(self):
+    return repr(dict(self))
+
+
 class Board:
   """
   Representation of a Zombie Board.
 
+  Board(backend="compact") returns a CompactBoard instead, see
+  BACKENDS for the available representations.
+
+  to_bytes returns a canonical encoding of the position, from which
+  Board(data) builds the board back with any backend. It is a compact
+  format for keys and stored positions only: it is not faster than
+  pickle, which remains the way to send boards between processes.
+
+  position_hash is a 64-bit Zobrist hash of the position, side_to_move
+  included, updated by each action; __hash__ and __eq__ are based on
+  it, so a board used as a dict key must not be played on afterwards.
+
   """
 
-  def __init__(self, percepts=None):
+  # (position_hash, articulation points, groups) of the last position
+  # whose articulation points have been computed
+  _articulation = None
+  # (position_hash, {(from_pos, avoid_isolated): traversal}) for the
+  # breadth-first traversals of the current position
+  _reachability = None
+  # (position_hash, {from_pos: tiles}) for the creeper moves of the
+  # current position
+  _creeper = None
+
+  def __new__(cls, percepts=None, backend=None):
+    if cls is Board and backend is not None:
+      if not backend in BACKENDS:
+        raise ValueError("unknown board backend: " + str(backend))
+      cls = BACKENDS[backend]
+    return object.__new__(cls)
+
+  def __init__(self, percepts=None, backend=None):
     """
     Constructor of the representation for a Zombies game.
-    The representation can be initialized by a percepts
+    The representation can be initialized by a percepts, or by the
+    bytes returned by to_bytes.
     If percepts==None:
         The board is empty and each player has the starting
         11 zombie pieces.
     """
-    self.pieces = {}
+    if isinstance(percepts, (bytes, bytearray)):
+      self.side_to_move, self.unplaced_pieces, self._tops, self._buried = \
+        _decode_position(percepts)
+      return
+    # The top piece of each tile, EMPTY for the empty ones
+    self._tops = {}
+    # For each hugger stack, the pieces under its top, bottom first
+    self._buried = {}
     self.unplaced_pieces = {}
+    self.side_to_move = PLAYER1
     if percepts is not None:
-      for piece in percepts.unplaced_pieces:
-        self.unplaced_pieces[piece] = percepts.unplaced_pieces[piece]
-      for (q_coord, r_coord) in percepts.pieces:
-        if type(percepts.pieces[q_coord, r_coord]) is list:
-          tmp_lst = []
-          for piece in percepts.pieces[q_coord, r_coord]:
-            tmp_lst.append(piece)
-          self.pieces[(q_coord, r_coord)] = tmp_lst
+      self.side_to_move = getattr(percepts, "side_to_move", PLAYER1)
+      unplaced_pieces = percepts.unplaced_pieces
+      for piece in unplaced_pieces:
+        self.unplaced_pieces[piece] = unplaced_pieces[piece]
+      if type(percepts) is Board:
+        self._tops = dict(percepts._tops)
+        for pos, buried in percepts._buried.items():
+          self._buried[pos] = list(buried)
+        self._locations = {}
+        for piece, positions in percepts._locations.items():
+          self._locations[piece] = set(positions)
+        self._degrees = dict(percepts._degrees)
+        self._touching = {}
+        self._placements = {}
+        for player in (PLAYER1, PLAYER2):
+          self._touching[player] = dict(percepts._touching[player])
+          self._placements[player] = set(percepts._placements[player])
+        self.position_hash = percepts.position_hash
+        return
+      pieces = percepts.pieces
+      for pos in pieces:
+        value = pieces[pos]
+        if type(value) is list:
+          self._tops[pos] = value[-1]
+          if len(value) > 1:
+            self._buried[pos] = list(value[:-1])
         else:
-          self.pieces[(q_coord, r_coord)] = percepts.pieces[(q_coord, r_coord)]
+          self._tops[pos] = value
     else:
       self.unplaced_pieces[NECROMANCER] = 1
       self.unplaced_pieces[HUGGER] = 2
@@ -103,7 +512,262 @@ class Board:
       self.unplaced_pieces[-JUMPER] = 3
       self.unplaced_pieces[-CREEPER] = 2
       self.unplaced_pieces[-SPRINTER] = 3
-      self.pieces[(0, 0)] = EMPTY
+      self._tops[(0, 0)] = EMPTY
+
+  def __getattr__(self, name):
+    """Builds the indexes and the hash of the position on first use.
+    They are left out of the boards decoded by Board(data) and of the
+    unpickled ones, which are then as cheap to build as their tiles."""
+    if name == "position_hash":
+      self.position_hash = self.compute_hash()
+      return self.position_hash
+    if name in ("_locations", "_degrees", "_touching", "_placements") and \
+      "_tops" in self.__dict__:
+      self._build_indexes()
+      return self.__dict__[name]
+    raise AttributeError("%r object has no attribute %r" %
+      (type(self).__name__, name))
+
+  @property
+  def pieces(self):
+    """The tiles of the board: a read-only mapping from each position
+    to its piece, EMPTY, or the list of the pieces of its hugger
+    stack, bottom first"""
+    return _PiecesView(self._tops, self._buried)
+
+  def _stack(self, pos):
+    """Returns the pieces of the tile at pos, bottom first; there is
+    none if the tile is empty or missing"""
+    top = self._tops.get(pos, EMPTY)
+    if top == EMPTY:
+      return ()
+    buried = self._buried.get(pos)
+    if buried is None:
+      return (top,)
+    return buried + [top]
+
+  def _tile_hash(self, pos):
+    """Returns the Zobrist hash of the tile at pos"""
+    key = _zobrist_tile(pos, 0, self._tops[pos])
+    buried = self._buried.get(pos)
+    if buried is not None:
+      key = _zobrist_tile(pos, len(buried), self._tops[pos])
+      for level, piece in enumerate(buried):
+        key ^= _zobrist_tile(pos, level, piece)
+    return key
+
+  def compute_hash(self):
+    """Returns the Zobrist hash of the position computed from
+    scratch"""
+    key = _ZOBRIST_SIDE if self.side_to_move == PLAYER2 else 0
+    unplaced_pieces = self.unplaced_pieces
+    for piece in unplaced_pieces:
+      key ^= _zobrist_unplaced(piece, unplaced_pieces[piece])
+    for pos, value in self.pieces.items():
+      key ^= _zobrist_value(pos, value)
+    return key
+
+  def __hash__(self):
+    return self.position_hash
+
+  def _tables(self):
+    """Returns (tops, buried): the top piece of each tile and the
+    pieces under the top of each hugger stack"""
+    return self._tops, self._buried
+
+  def _tiles(self):
+    """Returns (positions, values, stacks): the positions of the tiles,
+    their top pieces in the same order and the (position, pieces under
+    the top) pairs of the hugger stacks"""
+    tops, buried = self._tables()
+    return list(tops), list(tops.values()), list(buried.items())
+
+  def _unplaced_counts(self):
+    """Returns the numbers of unplaced pieces in the order of
+    _ENCODED_PIECES"""
+    return list(map(self.unplaced_pieces.get, _ENCODED_PIECES, _ENCODED_ZEROS))
+
+  def to_bytes(self):
+    """Returns the encoding of the position as a string of bytes, the
+    same for all the equal positions, whatever their backend. It is
+    about a quarter of the size of a pickled board, but slower to build
+    and to decode."""
+    tops, buried = self._tables()
+    return _encode_position(self.side_to_move, self.unplaced_pieces, tops, buried)
+
+  def canonical_key(self):
+    """Returns (key, symmetry). key identifies the position up to the
+    translations, rotations and reflections of the grid, which leave
+    the rules unchanged: it is the to_bytes encoding of the canonical
+    position, which Board(key) builds. symmetry maps the tiles and the
+    actions of the board to those of the canonical position.
+
+    The canonical position is, among the images of the board by the 12
+    symmetries of the grid fixing (0, 0), translated so that their
+    smallest q and r are 0, the one with the smallest encoding.
+
+    """
+    positions, values, stacks = self._tiles()
+    side_to_move = self.side_to_move
+    unplaced = self._unplaced_counts()
+    best = None
+    for symmetry in _SYMMETRIES:
+      a, b, c, d = symmetry.matrix
+      q_coords = [a * q + b * r for q, r in positions]
+      r_coords = [c * q + d * r for q, r in positions]
+      origin_q = min(q_coords, default=0)
+      origin_r = min(r_coords, default=0)
+      if q_coords and (max(q_coords) - origin_q >= 128 or max(r_coords) - origin_r >= 128):
+        raise ValueError("board too large to encode")
+      # The keys of _TileKeys of the translated images
+      shift_q = (128 - origin_q) << 16
+      shift_r = (128 - origin_r) << 8
+      keys = sorted([((q << 16) + shift_q) + ((r << 8) + shift_r) + 128 + top
+        for q, r, top in zip(q_coords, r_coords, values)])
+      image_buried = {(a * q + b * r - origin_q, c * q + d * r - origin_r): below
+        for (q, r), below in stacks}
+      key = _encode_keys(side_to_move, unplaced, 0, 0, keys, image_buried)
+      if best is None or key < best[0]:
+        best = (key, symmetry, (-origin_q, -origin_r))
+    key, symmetry, offset = best
+    return key, Symmetry(symmetry.mirror, symmetry.rotation, offset)
+
+  @classmethod
+  def from_bytes(cls, data, backend=None):
+    """Returns the board encoded in data by to_bytes, built by cls or
+    by the given backend"""
+    return cls(data, backend=backend)
+
+  def __getstate__(self):
+    """Pickles the tiles, the unplaced pieces, the side to move and the
+    hash of the position if it is known, without the indexes"""
+    state = {"_tops": self._tops, "_buried": self._buried,
+      "unplaced_pieces": self.unplaced_pieces,
+      "side_to_move": self.side_to_move}
+    if "position_hash" in self.__dict__:
+      state["position_hash"] = self.position_hash
+    return state
+
+  def __setstate__(self, state):
+    """Restores a pickled board, including one pickled with all its
+    attributes by the versions preceding the indexes"""
+    if "pieces" in state:
+      self.__init__(types.SimpleNamespace(**state))
+    else:
+      self.__dict__.update(state)
+
+  def _build_indexes(self):
+    """Builds the location index, the occupied degrees and the
+    placement frontiers of the tiles at once"""
+    # For each piece, the positions of the tiles holding it
+    self._locations = {}
+    # For each position, the number of its non-empty neighbours
+    self._degrees = {}
+    # For each player, the number of neighbours of each position
+    # holding one of its pieces, and the empty tiles at which it can
+    # place a piece after the second step
+    self._touching = {PLAYER1: {}, PLAYER2: {}}
+    self._placements = {PLAYER1: set(), PLAYER2: set()}
+    tops = self._tops
+    occupied = [pos for pos in tops if tops[pos] != EMPTY]
+    neighbourhoods = [_neighbours(pos) for pos in occupied]
+    self._degrees.update(collections.Counter(itertools.chain.from_iterable(neighbourhoods)))
+    locations = self._locations
+    owned = {PLAYER1: [], PLAYER2: []}
+    for pos, neighbours in zip(occupied, neighbourhoods):
+      top = tops[pos]
+      if pos in self._buried:
+        stack = self._stack(pos)
+        for piece in stack:
+          locations.setdefault(piece, set()).add(pos)
+        for player in set(PLAYER1 if piece > 0 else PLAYER2 for piece in stack):
+          owned[player].append(neighbours)
+      else:
+        locations.setdefault(top, set()).add(pos)
+        owned[PLAYER1 if top > 0 else PLAYER2].append(neighbours)
+    for player in (PLAYER1, PLAYER2):
+      self._touching[player].update(collections.Counter(itertools.chain.from_iterable(owned[player])))
+    for player in (PLAYER1, PLAYER2):
+      opponent = self._touching[-player]
+      self._placements[player] = set(pos for pos in self._touching[player]
+        if tops.get(pos) == EMPTY and not opponent.get(pos, 0))
+
+  def _index_tile(self, pos):
+    """Adds the pieces of the tile at pos to the location index and
+    to the placement frontiers"""
+    stack = self._stack(pos)
+    for piece in stack:
+      self._locations.setdefault(piece, set()).add(pos)
+    for player in set(PLAYER1 if piece > 0 else PLAYER2 for piece in stack):
+      touching = self._touching[player]
+      for neighbour_pos in _neighbours(pos):
+        touching[neighbour_pos] = touching.get(neighbour_pos, 0) + 1
+    self._refresh_placement(pos)
+    for neighbour_pos in _neighbours(pos):
+      self._refresh_placement(neighbour_pos)
+
+  def _unindex_tile(self, pos):
+    """Removes the pieces of the tile at pos, before it changes, from
+    the location index and from the placement frontiers. The
+    placements around pos are updated by the next _index_tile of
+    pos."""
+    self._placements[PLAYER1].discard(pos)
+    self._placements[PLAYER2].discard(pos)
+    stack = self._stack(pos)
+    for piece in stack:
+      self._locations[piece].discard(pos)
+    for player in set(PLAYER1 if piece > 0 else PLAYER2 for piece in stack):
+      touching = self._touching[player]
+      for neighbour_pos in _neighbours(pos):
+        touching[neighbour_pos] -= 1
+
+  def _refresh_placement(self, pos):
+    """Adds pos to or removes it from the placement frontier of each
+    player: it belongs to it if it is an empty tile adjacent to a piece
+    of the player and to no piece of its opponent"""
+    if self._tops.get(pos) != EMPTY:
+      self._placements[PLAYER1].discard(pos)
+      self._placements[PLAYER2].discard(pos)
+      return
+    ones = self._touching[PLAYER1].get(pos, 0)
+    twos = self._touching[PLAYER2].get(pos, 0)
+    for player, own, other in ((PLAYER1, ones, twos), (PLAYER2, twos, ones)):
+      if own and not other:
+        self._placements[player].add(pos)
+      else:
+        self._placements[player].discard(pos)
+
+  def _occupy(self, pos, count):
+    """Adds count to the occupied degree of the neighbours of pos:
+    1 when the tile at pos becomes non-empty, -1 when it becomes
+    empty"""
+    degrees = self._degrees
+    for neighbour_pos in _neighbours(pos):
+      degrees[neighbour_pos] = degrees.get(neighbour_pos, 0) + count
+
+  def occupied_degree(self, pos):
+    """Returns the number of non-empty tiles adjacent to pos"""
+    return self._degrees.get(pos, 0)
+
+  def locate(self, piece):
+    """Returns the set of the positions of the tiles holding piece,
+    at any level of their stack"""
+    return set(self._locations.get(piece, ()))
+
+  def necromancer_pos(self, player):
+    """Returns the position of the necromancer of player, or None if
+    it has not been placed"""
+    for pos in self._locations.get(player * NECROMANCER, ()):
+      return pos
+    return None
+
+  def __eq__(self, other):
+    if not isinstance(other, Board):
+      return NotImplemented
+    return self.position_hash == other.position_hash and \
+      self.side_to_move == other.side_to_move and \
+      self.unplaced_pieces == other.unplaced_pieces and \
+      self.pieces == other.pieces
 
   def pretty_print(self):
     """Print of the representation"""
@@ -130,42 +794,21 @@ class Board:
 
   def tile_str(self, q, r):
     """String representation of a tile on the board"""
-    tile_repr = ""
-    if type(self.pieces[(q, r)]) is int:
-      tile_repr += PIECE_NAMES[abs(self.pieces[(q, r)])]
-      if self.pieces[q, r] < 0:
-        tile_repr += " (P2)"
-      elif self.pieces[q, r] > 0:
-        tile_repr += " (P1)"
-    else:
-      tile_repr += "["
-      for i in range(len(self.pieces[(q, r)]) - 1):
-        tile_repr += PIECE_NAMES[abs(self.pieces[(q, r)][i])]
-        if self.pieces[q, r][i] < 0:
-          tile_repr += " (P2), "
-        else:
-          tile_repr += " (P1), "
-      tile_repr += PIECE_NAMES[abs(self.pieces[(q, r)][-1])]
-      if self.pieces[q, r][-1] < 0:
-        tile_repr += " (P2)]"
-      else:
-        tile_repr += " (P1)]"
-    return tile_repr
+    names = []
+    for piece in self._stack((q, r)) or (self._tops[(q, r)],):
+      name = PIECE_NAMES[abs(piece)]
+      if piece < 0:
+        name += " (P2)"
+      elif piece > 0:
+        name += " (P1)"
+      names.append(name)
+    if len(names) == 1:
+      return names[0]
+    return "[" + ", ".join(names) + "]"
 
   def clone(self):
     """Return a clone of this object."""
-    clone_board = Board()
-    for piece in self.unplaced_pieces:
-      clone_board.unplaced_pieces[piece] = self.unplaced_pieces[piece]
-    for (q_coord, r_coord) in self.pieces:
-      if type(self.pieces[q_coord, r_coord]) is list:
-        tmp_lst = []
-        for piece in self.pieces[q_coord, r_coord]:
-          tmp_lst.append(piece)
-        clone_board.pieces[(q_coord, r_coord)] = tmp_lst
-      else:
-        clone_board.pieces[(q_coord, r_coord)] = self.pieces[(q_coord, r_coord)]
-    return clone_board
+    return Board(self)
 
   def is_move_valid(self, former_pos, new_pos, player):
     """Returns true if the player can move piece from
@@ -178,24 +821,23 @@ class Board:
       return False
 
     #Checks whether the coordinates are known
-    if not (former_pos in self.pieces and new_pos in self.pieces):
+    if not (former_pos in self._tops and new_pos in self._tops):
       return False
 
     #If the move makes the pieces not connected, or if the piece
     #moving is isolated, it is not valid
     if not self.pieces_are_connected_without(former_pos) or \
-      (type(self.pieces[former_pos]) is int and self.is_position_isolated(new_pos, former_pos)):
+      (not former_pos in self._buried and self.is_position_isolated(new_pos, former_pos)):
       return False
 
-    #Get the upper piece in case there is a stack of pieces at position 
-    former_piece = self.pieces[former_pos] if not type(self.pieces[former_pos]) is list else self.pieces[former_pos][-1]
-    new_piece = self.pieces[new_pos] if not type(self.pieces[new_pos]) is list else self.pieces[new_pos][-1]
-    
+    #The upper piece in case there is a stack of pieces at position
+    former_piece = self._tops[former_pos]
+
     if former_piece * player <= 0:
       return False
     if former_piece * player == NECROMANCER:
       return (new_q != former_q or new_r != former_r) and abs(new_q - former_q) <= 1 and \
-        abs(new_r - former_r) <= 1 and self.pieces[new_pos] == EMPTY and \
+        abs(new_r - former_r) <= 1 and self._tops[new_pos] == EMPTY and \
         self.respects_move_liberty(former_pos, new_pos)
     if former_piece * player == HUGGER:
       return former_pos != new_pos and abs(new_q - former_q) <= 1 and \
@@ -214,7 +856,7 @@ class Board:
     if self.pieces_are_connected_without(necro_pos):
       neighbour_tiles = self.get_neighbouring_tiles(necro_pos)
       for new_pos in neighbour_tiles:
-        if self.pieces[new_pos] == EMPTY and \
+        if self._tops[new_pos] == EMPTY and \
           self.respects_move_liberty(necro_pos, new_pos) and \
           not self.is_position_isolated(new_pos, necro_pos):
           necro_moves.append(new_pos)
@@ -226,7 +868,7 @@ class Board:
     hugger_moves = []
     if self.pieces_are_connected_without(hugger_pos):
       neighbour_tiles = self.get_neighbouring_tiles(hugger_pos)
-      if (type(self.pieces[hugger_pos]) is list):
+      if hugger_pos in self._buried:
         hugger_moves += neighbour_tiles
       else:
         for new_pos in neighbour_tiles:
@@ -239,11 +881,10 @@ class Board:
     by the jumper zombie currently placed at jumper_pos"""
     jumper_moves = []
     if self.pieces_are_connected_without(jumper_pos):
-      line_unit_vectors = [(1,  0), (1, -1), (0, -1), (-1,  0), (-1, 1), (0, 1)]
-      for dir_q, dir_r in line_unit_vectors:
+      for dir_q, dir_r in _NEIGHBOUR_DELTAS:
         jump_length = 1
         potential_pos = (jumper_pos[0] + dir_q, jumper_pos[1] + dir_r)
-        while potential_pos in self.pieces and self.pieces[potential_pos] != EMPTY:
+        while self._tops.get(potential_pos, EMPTY) != EMPTY:
           potential_pos = (potential_pos[0] + dir_q, potential_pos[1] + dir_r)
           jump_length += 1
         if jump_length > 1:
@@ -253,49 +894,48 @@ class Board:
   def get_creeper_moves(self, creeper_pos):
     """Returns a list of the new positions that can be attained
     by the creeper zombie currently placed at creeper_pos"""
-    creeper_moves = []
     if self.pieces_are_connected_without(creeper_pos):
-      paths = self.find_all_paths_of_size(creeper_pos, 3, creeper_pos)
-      for path in paths:
-        creeper_moves.append(path[-1])
-    return creeper_moves
+      return list(self._triple_moves(creeper_pos))
+    return []
 
   def get_sprinter_moves(self, sprinter_pos):
     """Returns a list of the new positions that can be attained
     by the sprinter zombie currently placed at sprinter_pos"""
-    sprinter_moves = []
     if self.pieces_are_connected_without(sprinter_pos):
-      empty_tiles = self.get_empty_tiles()
-      sprinter_moves.append(sprinter_pos)
-      new_component_found = True
-      while(new_component_found):
-        new_component_found = False
-        for empty_tile in empty_tiles:
-          for attainable_tile in sprinter_moves:
-            if self.respects_move_liberty(attainable_tile, empty_tile) and \
-              not self.is_position_isolated(empty_tile, sprinter_pos):
-              empty_tiles.remove(empty_tile)
-              sprinter_moves.append(empty_tile)
-              new_component_found = True
-              break
-      sprinter_moves.remove(sprinter_pos)
-    return sprinter_moves
+      return self.reachable_tiles(sprinter_pos)
+    return []
+
+  def reachable_tiles(self, from_pos, avoid_isolated=True):
+    """Returns the empty tiles which the piece at from_pos can reach
+    by sliding from empty tile to empty tile while respecting the move
+    liberty, in breadth-first order. The piece is considered to stay at
+    from_pos while it slides.
+
+    If avoid_isolated, the tiles whose only non-empty neighbour is
+    from_pos (see is_position_isolated) are neither reached nor
+    crossed, as for sprinter moves; validation of multi-tile moves
+    only checks this on the destination.
+
+    """
+    if not from_pos in self._tops:
+      raise NonExistingTile(from_pos)
+    distances = self._traverse(from_pos, avoid_isolated)[0]
+    return [pos for pos in distances if pos != from_pos]
 
   def jumps_in_line(self, from_pos, to_pos):
     """Returns True if the line between from_pos and to_pos
     intersects perpendicularly the tile edges and only
     crosses non-empty tiles; False otherwise"""
-    line_unit_vectors = [(1,  0), (1, -1), (0, -1), (-1,  0), (-1, 1), (0, 1)]
     from_q, from_r = from_pos
     to_q, to_r = to_pos
     delta_q = to_q - from_q
     delta_r = to_r - from_r
     mult_factor = max(abs(delta_q), abs(delta_r))
-    for dir_q, dir_r in line_unit_vectors:
+    for dir_q, dir_r in _NEIGHBOUR_DELTAS:
       if mult_factor * dir_q == delta_q and \
         mult_factor * dir_r == delta_r:
         for i in range(1, mult_factor):
-          if not (from_q + i * dir_q, from_r + i * dir_r) in self.pieces:
+          if not (from_q + i * dir_q, from_r + i * dir_r) in self._tops:
             return False
         return True
     return False
@@ -305,13 +945,46 @@ class Board:
     of length 3 between from_pos and to_pos such that it
     respects move liberty and doesn't go back on its own step;
     False otherwise"""
-    if not to_pos in self.pieces or self.pieces[to_pos] != EMPTY:
+    if not to_pos in self._tops or self._tops[to_pos] != EMPTY:
       return False
-    for path in self.find_all_paths_of_size(from_pos, 3, from_pos):
-      if path[-1] == to_pos:
-        return True
-    return False
-    
+    return to_pos in self._triple_moves(from_pos)
+
+  def _triple_moves(self, from_pos):
+    """Returns the distinct ends of the paths of
+    find_all_paths_of_size(from_pos, 3, from_pos), as the keys of a
+    dict in the order of the paths. The result is cached until the
+    position changes and must not be modified."""
+    cache = self._creeper
+    if cache is None or cache[0] != self.position_hash:
+      cache = self._creeper = (self.position_hash, {})
+    ends = cache[1].get(from_pos)
+    if ends is None:
+      ends = cache[1][from_pos] = {}
+      # Depth-first search with an explicit stack of (tile, depth);
+      # path holds the tiles leading to the one popped. The steps from
+      # a tile do not depend on the path, so they are computed once.
+      steps = {}
+      path = []
+      stack = [(from_pos, 0)]
+      while stack:
+        pos, depth = stack.pop()
+        del path[depth:]
+        path.append(pos)
+        if depth == 3:
+          ends[pos] = None
+          continue
+        next_steps = steps.get(pos)
+        if next_steps is None:
+          next_steps = steps[pos] = [new_pos for new_pos in
+            reversed(self.get_neighbouring_tiles(pos)) \
+            if new_pos in self._tops and \
+            self.respects_move_liberty(pos, new_pos) and \
+            not self.is_position_isolated(new_pos, from_pos)]
+        for new_pos in next_steps:
+          if not new_pos in path:
+            stack.append((new_pos, depth + 1))
+    return ends
+
   def find_all_paths_of_size(self, start_pos, size, orig_pos, path=[]):
     """Returns a list containing all the paths of the given size
     between start_pos and any position such that they respect
@@ -322,7 +995,7 @@ class Board:
     paths = []
     potential_positions = [coord for coord in
       self.get_neighbouring_tiles(start_pos) \
-      if coord in self.pieces and \
+      if coord in self._tops and \
       self.respects_move_liberty(start_pos, coord)]
     for new_pos in potential_positions:
       if new_pos not in path and not self.is_position_isolated(new_pos, orig_pos):
@@ -360,120 +1033,122 @@ class Board:
     between from_pos and to_pos such that it respects move
     liberty and doesn't go back on its own step;
     False otherwise"""
-    if not from_pos in self.pieces:
+    if not from_pos in self._tops:
       raise NonExistingTile(from_pos)
-    if not to_pos in self.pieces:
+    if not to_pos in self._tops:
       raise NonExistingTile(to_pos)
-    if self.pieces[to_pos] != EMPTY or \
+    if self._tops[to_pos] != EMPTY or \
       not self.pieces_are_connected_without(from_pos):
       return False
-    try:
-      self.get_shortest_path(from_pos, to_pos)
-      return True
-    except NoPath:
-      return False
+    return to_pos in self.reachable_tiles(from_pos, avoid_isolated=False)
 
   def get_shortest_path(self, start_pos, end_pos):
     """Returns a shortest path between start_pos and end_pos
     such that every move performed respects the move liberty."""
     if start_pos == end_pos:
       return []
-    visited = {}
-    # Predecessor matrix in the BFS
-    prede = {}
-    prede[start_pos] = None
-
-    for empty_tile in self.get_empty_tiles():
-      visited[empty_tile] = False
-      prede[empty_tile] = None
-    
-    neighbours = [start_pos]
-
-    while len(neighbours) > 0:
-      neighbour = neighbours.pop(0)
-      visited[neighbour] = True
-      
-      if neighbour == end_pos:
-        succ = [neighbour]
-        curr = prede[neighbour]
-        while curr is not None and curr != start_pos:
-          succ.append(curr)
-          curr = prede[curr]
-        succ.reverse()
-        return succ
-      
-      unvisited_succ = [coord for coord in
-        self.get_neighbouring_tiles(neighbour) \
-        if coord in self.pieces and \
-        self.respects_move_liberty(neighbour, coord) and \
-        not visited[coord]]
-      for coord in unvisited_succ:
-        if not coord in neighbours:
-          neighbours.append(coord)
-          prede[coord] = neighbour
-    raise NoPath()
+    distances, predecessors = self._traverse(start_pos, False)
+    if not end_pos in predecessors:
+      raise NoPath()
+    path = []
+    pos = end_pos
+    while pos != start_pos:
+      path.append(pos)
+      pos = predecessors[pos]
+    path.reverse()
+    return path
+
+  def get_distances(self, from_pos, avoid_isolated=True):
+    """Returns a dict giving the number of steps from from_pos to
+    from_pos itself and to each tile of
+    reachable_tiles(from_pos, avoid_isolated)."""
+    if not from_pos in self._tops:
+      raise NonExistingTile(from_pos)
+    return dict(self._traverse(from_pos, avoid_isolated)[0])
+
+  def _traverse(self, from_pos, avoid_isolated):
+    """Returns (distances, predecessors), the breadth-first traversal
+    from from_pos behind reachable_tiles, get_distances and
+    get_shortest_path. The traversals are cached until the position
+    changes; the dicts returned must not be modified."""
+    cache = self._reachability
+    if cache is None or cache[0] != self.position_hash:
+      cache = self._reachability = (self.position_hash, {})
+    traversal = cache[1].get((from_pos, avoid_isolated))
+    if traversal is None:
+      distances = {from_pos: 0}
+      predecessors = {from_pos: None}
+      queue = collections.deque([from_pos])
+      while queue:
+        pos = queue.popleft()
+        for new_pos in self.get_neighbouring_tiles(pos):
+          if not new_pos in distances and new_pos in self._tops and \
+            self.respects_move_liberty(pos, new_pos) and \
+            not (avoid_isolated and self.is_position_isolated(new_pos, from_pos)):
+            distances[new_pos] = distances[pos] + 1
+            predecessors[new_pos] = pos
+            queue.append(new_pos)
+      traversal = cache[1][(from_pos, avoid_isolated)] = (distances, predecessors)
+    return traversal
 
   def pieces_are_connected_without(self, piece_pos_moving):
     """Returns True if the pieces are still connected without
     the (top) piece positioned at piece_pos_moving"""
-    if not piece_pos_moving in self.pieces:
+    if not piece_pos_moving in self._tops:
       raise NonExistingTile(piece_pos_moving)
-    if type(self.pieces[piece_pos_moving]) is list:
+    if piece_pos_moving in self._buried:
       return True
-    piece_coords = []
-    for piece_pos in self.pieces:
-      if piece_pos != piece_pos_moving and self.pieces[piece_pos] != EMPTY:
-        piece_coords.append(piece_pos)
-    l = [piece_coords[-1]]
-    k = [piece_coords[-1]]
-    while k:
-      x = k.pop(-1)
-      for new_pos in piece_coords:
-        if self.are_neighbours(x, new_pos) and not new_pos in l:
-          l.append(new_pos)
-          k.append(new_pos)
-    return len(l) == len(piece_coords)
+    points, groups = self.get_articulation_points()
+    if self._tops[piece_pos_moving] == EMPTY:
+      return groups <= 1
+    if groups == 1:
+      return not piece_pos_moving in points
+    # The piece may be alone, apart from the other ones
+    return groups == 2 and not self.occupied_degree(piece_pos_moving)
+
+  def get_articulation_points(self):
+    """Returns (points, groups): the set of the positions of the pieces
+    which cannot leave without splitting the other pieces, and the
+    number of groups of connected pieces (1 in a valid position).
+
+    It is computed once per position, with Tarjan's algorithm.
+
+    """
+    cache = self._articulation
+    if cache is None or cache[0] != self.position_hash:
+      occupied = set()
+      for pos in self._tops:
+        if self._tops[pos] != EMPTY:
+          occupied.add(pos)
+      points, groups = _articulation_points(occupied,
+                                            self.get_neighbouring_tiles)
+      cache = self._articulation = (self.position_hash, points, groups)
+    return cache[1], cache[2]
 
   def is_position_isolated(self, new_pos, orig_pos):
     """Returns True if new_pos has no non-empty neighbour or
     that its only neighbour is orig_pos; False otherwise"""
-    non_empty_neighbours = self.get_non_empty_neighbours(new_pos)
-    return len(non_empty_neighbours) == 1 and \
-      non_empty_neighbours[0] == orig_pos
+    if self._degrees.get(new_pos, 0) != 1:
+      return False
+    return orig_pos in _neighbours(new_pos) and \
+      self._tops.get(orig_pos, EMPTY) != EMPTY
 
   def respects_move_liberty(self, pos1, pos2):
     """Returns True if moving a piece from pos1 to pos2 respects
     the move liberty; False otherwise"""
-    if not pos1 in self.pieces:
+    if not pos1 in self._tops:
       raise NonExistingTile(pos1)
-    if not pos2 in self.pieces:
+    if not pos2 in self._tops:
       raise NonExistingTile(pos2)
-    if self.pieces[pos2] != EMPTY:
+    if self._tops[pos2] != EMPTY:
       return False
-    q1, r1 = pos1
-    q2, r2 = pos2
-    q_dist = q2 - q1
-    r_dist = r2 - r1
-    if q_dist == 1 and r_dist == -1:
-      return (not (q1, r1 - 1) in self.pieces) or (not (q1 + 1, r1) in self.pieces) or \
-        (self.pieces[(q1, r1 - 1)] == EMPTY) or (self.pieces[(q1 + 1, r1)] == EMPTY)
-    elif q_dist == 1 and r_dist == 0:
-      return (not (q1 + 1, r1 - 1) in self.pieces) or (not (q1, r1 + 1) in self.pieces) or \
-        (self.pieces[(q1 + 1, r1 - 1)] == EMPTY) or (self.pieces[(q1, r1 + 1)] == EMPTY)
-    elif q_dist == 0 and r_dist == 1:
-      return (not (q1 + 1, r1) in self.pieces) or (not (q1 - 1, r1 + 1) in self.pieces) or \
-        (self.pieces[(q1 + 1, r1)] == EMPTY) or (self.pieces[(q1 - 1, r1 + 1)] == EMPTY)
-    elif q_dist == -1 and r_dist == 1:
-      return (not (q1, r1 + 1) in self.pieces) or (not (q1 - 1, r1) in self.pieces) or \
-        (self.pieces[(q1, r1 + 1)] == EMPTY) or (self.pieces[(q1 - 1, r1)] == EMPTY)
-    elif q_dist == -1 and r_dist == 0:
-      return (not (q1, r1 - 1) in self.pieces) or (not (q1 - 1, r1 + 1) in self.pieces) or \
-        (self.pieces[(q1, r1 - 1)] == EMPTY) or (self.pieces[(q1 - 1, r1 + 1)] == EMPTY)
-    elif q_dist == 0 and r_dist == -1:
-      return (not (q1 + 1, r1 - 1) in self.pieces) or (not (q1 - 1, r1) in self.pieces) or \
-        (self.pieces[(q1 + 1, r1 - 1)] == EMPTY) or (self.pieces[(q1 - 1, r1)] == EMPTY)
-    else:
+    direction = _DIRECTIONS.get((pos2[0] - pos1[0], pos2[1] - pos1[1]))
+    if direction is None:
       return False
+    tiles = _neighbours(pos1)
+    left, right = _GATES[direction]
+    return self._tops.get(tiles[left], EMPTY) == EMPTY or \
+      self._tops.get(tiles[right], EMPTY) == EMPTY
 
   def are_neighbours(self, pos1, pos2):
     """Returns True if the two positions are neighbour hex,
@@ -487,29 +1162,22 @@ class Board:
     return (abs(q1 - q2) + abs(r1 - r2) + abs(q1 + r1 - q2 - r2)) / 2
 
   def get_neighbouring_tiles(self, pos):
-    """Returns all hex positions which are adjacent to pos"""
-    q, r = pos
-    neighbour_deltas = [(1,  0), (1, -1), (0, -1), (-1,  0), (-1, 1), (0, 1)]
-    neighbour_tiles = []
-    for (delta_q, delta_r) in neighbour_deltas:
-      neighbour_tiles.append((q + delta_q, r + delta_r))
-    return neighbour_tiles
+    """Returns all hex positions which are adjacent to pos,
+    as a tuple shared between calls"""
+    return _neighbours(pos)
 
   def get_non_empty_neighbours(self, pos):
     """Returns a list of all the non-empty hex positions
     adjacent to pos"""
-    non_empty_neighbours = []
-    for neighbour_pos in self.get_neighbouring_tiles(pos):
-      if neighbour_pos in self.pieces and \
-        self.pieces[neighbour_pos] != EMPTY:
-        non_empty_neighbours.append(neighbour_pos)
-    return non_empty_neighbours
+    tops = self._tops
+    return [neighbour_pos for neighbour_pos in _neighbours(pos)
+      if tops.get(neighbour_pos, EMPTY) != EMPTY]
 
   def get_empty_tiles(self):
     """Returns all hex positions of the empty tiles"""
     empty_positions = []
-    for pos in self.pieces:
-      if self.pieces[pos] == EMPTY:
+    for pos in self._tops:
+      if self._tops[pos] == EMPTY:
         empty_positions.append(pos)
     return empty_positions
 
@@ -520,76 +1188,74 @@ class Board:
     if piece * player < 0 or qty < 1 or \
       not piece in self.unplaced_pieces or \
       self.unplaced_pieces[piece] != qty or \
-      not position in self.pieces:
+      not position in self._tops:
       return False
     #The two first steps must allow to put a piece
     #on empty board or adjacent to an opponent piece
     if step <= 2:
       return True
+    if self._tops[position] == EMPTY:
+      return position in self._placements[player]
     non_empty_neighbours = self.get_non_empty_neighbours(position)
     for neighbour in non_empty_neighbours:
-      if neighbour in self.pieces:
-        if type(self.pieces[neighbour]) is int:
-          if self.pieces[neighbour] * player < 0:
-            return False
-        else:
-          for piece in self.pieces[neighbour]:
-            if piece * player < 0:
-              return False
+      for piece in self._stack(neighbour):
+        if piece * player < 0:
+          return False
     return len(non_empty_neighbours) > 0
 
   def get_possible_placements(self, player, step):
     """Returns all hex positions at which player can place a piece"""
-    empty_tiles = self.get_empty_tiles()
     if step <= 2:
-      return empty_tiles
-    possible_placements = []
-    for empty_tile in empty_tiles:
-      neighbours = self.get_neighbouring_tiles(empty_tile)
-      neighbour_index = 0
-      is_connected = False
-      no_opponent_adjacent = True
-      while neighbour_index < len(neighbours) and \
-        no_opponent_adjacent:
-        if neighbours[neighbour_index] in self.pieces:
-          if type(self.pieces[neighbours[neighbour_index]]) is int:
-            if self.pieces[neighbours[neighbour_index]] * player > 0:
-              is_connected = True
-            elif self.pieces[neighbours[neighbour_index]] * player < 0:
-              no_opponent_adjacent = False
-          else:
-            for i in range(len(self.pieces[neighbours[neighbour_index]])):
-              if self.pieces[neighbours[neighbour_index]][i] * player < 0:
-                no_opponent_adjacent = False
-            if no_opponent_adjacent:
-              is_connected = True
-        neighbour_index += 1
-      if is_connected and no_opponent_adjacent:
-        possible_placements.append(empty_tile)
-    return possible_placements
+      return self.get_empty_tiles()
+    return list(self._placements[player])
 
   def get_actions(self, player, step):
     """ Returns all the possible actions for player."""
-    possible_placements = self.get_possible_placements(player, step)
-    placement_actions = []
-    move_actions = []
+    return list(self.iter_actions(player, step))
+
+  def iter_actions(self, player, step, order=None):
+    """Yields the possible actions for player, computing the
+    placements and the moves of each piece only when they are reached.
+
+    Arguments:
+    order -- a sequence of piece types, e.g. (SPRINTER, JUMPER), whose
+      placements and moves are yielded first, kind by kind, or None to
+      yield the actions in the order of get_actions: placements, then
+      moves
+
+    The board may be changed between two actions, with do_action, as
+    long as undo restores it before the next one is asked for.
+
+    """
+    necromancer = player * NECROMANCER
+    placements = None
+    found = False
     #Each player must play its necromancer before its fourth turn
-    if (step == 7 or step == 8) and \
-      self.unplaced_pieces[player * NECROMANCER] > 0:
-      for pos in possible_placements:
-        placement_actions.append(('P', (player * NECROMANCER, self.unplaced_pieces[player * NECROMANCER]), pos))
-    else:
+    if (step == 7 or step == 8) and self.unplaced_pieces[necromancer] > 0:
+      for pos in self.get_possible_placements(player, step):
+        found = True
+        yield ('P', (necromancer, self.unplaced_pieces[necromancer]), pos)
+      if not found:
+        yield ('S', (0, 0), (0, 0))
+      return
+    kinds = [None]
+    if order is not None:
+      kinds = list(order) + [kind for kind in range(NECROMANCER, SPRINTER + 1)
+                             if not kind in order]
+    for kind in kinds:
       for piece in self.unplaced_pieces:
-        if piece * player > 0 and self.unplaced_pieces[piece] > 0:
-          for (q_coord, r_coord) in possible_placements:
-            placement_actions.append(('P', (piece, self.unplaced_pieces[piece]), (q_coord, r_coord)))
-      if self.unplaced_pieces[player * NECROMANCER] == 0:
-        for former_pos in self.pieces:
-          if type(self.pieces[former_pos]) is int:
-            piece_type = self.pieces[former_pos] * player
-          else:
-            piece_type = self.pieces[former_pos][-1] * player
-          if piece_type > 0:
+        if piece * player > 0 and self.unplaced_pieces[piece] > 0 and \
+            (kind is None or piece * player == kind):
+          if placements is None:
+            placements = self.get_possible_placements(player, step)
+          for (q_coord, r_coord) in placements:
+            found = True
+            yield ('P', (piece, self.unplaced_pieces[piece]), (q_coord, r_coord))
+      if self.unplaced_pieces[necromancer] == 0:
+        # do_action and undo reinsert the tiles they change
+        for former_pos in list(self._tops):
+          piece_type = self._tops[former_pos] * player
+          if piece_type > 0 and (kind is None or piece_type == kind):
             new_positions = []
             if piece_type == NECROMANCER:
               new_positions = self.get_necromancer_moves(former_pos)
@@ -602,12 +1268,10 @@ class Board:
             elif piece_type == SPRINTER:
               new_positions = self.get_sprinter_moves(former_pos)
             for new_pos in new_positions:
-              move_actions.append(('M', former_pos, new_pos))
-    possible_moves = placement_actions + move_actions
-    if possible_moves:
-      return possible_moves
-    else:
-      return [('S', (0, 0), (0, 0))]
+              found = True
+              yield ('M', former_pos, new_pos)
+    if not found:
+      yield ('S', (0, 0), (0, 0))
 
   def is_action_valid(self, action, player, step):
     """Returns True if the action played by player
@@ -637,46 +1301,75 @@ class Board:
     described by piece_desc at position to_pos.
     """
     (piece, qty) = piece_desc
+    key = self.position_hash
+    if piece in self.unplaced_pieces:
+      key ^= _zobrist_unplaced(piece, self.unplaced_pieces[piece])
+    key ^= _zobrist_unplaced(piece, qty - 1)
     self.unplaced_pieces[piece] = qty - 1
-    self.pieces[to_pos] = piece
-    for neighbour_pos in self.get_neighbouring_tiles(to_pos):
-      if not neighbour_pos in self.pieces:
-        self.pieces[neighbour_pos] = EMPTY
+    tops = self._tops
+    if tops.get(to_pos, EMPTY) == EMPTY:
+      self._occupy(to_pos, 1)
+    if to_pos in tops:
+      key ^= self._tile_hash(to_pos)
+      self._unindex_tile(to_pos)
+      self._buried.pop(to_pos, None)
+    tops[to_pos] = piece
+    key ^= _zobrist_tile(to_pos, 0, piece)
+    for neighbour_pos in _neighbours(to_pos):
+      if not neighbour_pos in tops:
+        tops[neighbour_pos] = EMPTY
+        key ^= _zobrist_tile(neighbour_pos, 0, EMPTY)
+    self._index_tile(to_pos)
+    self.position_hash = key
 
   def move_piece(self, from_pos, to_pos, player):
-    """Changes the board by placing the unplaced piece
-    described by piece_desc at position to_pos.
+    """Changes the board by moving the (top) piece at from_pos
+    to to_pos.
     """
-    if type(self.pieces[from_pos]) is list:
-      moving_piece = self.pieces[from_pos].pop()
-      if len(self.pieces[from_pos]) == 1:
-        self.pieces[from_pos] = self.pieces[from_pos][0]
-      if type(self.pieces[to_pos]) is list:
-        self.pieces[to_pos].append(moving_piece)
-      else:
-        if self.pieces[to_pos] == EMPTY:
-          self.pieces[to_pos] = moving_piece
-        else:
-          self.pieces[to_pos] = [self.pieces[to_pos], moving_piece]
-        for neighbour_pos in self.get_neighbouring_tiles(to_pos):
-          if not neighbour_pos in self.pieces:
-            self.pieces[neighbour_pos] = EMPTY
+    tops = self._tops
+    buried = self._buried
+    key = self.position_hash
+    self._unindex_tile(from_pos)
+    self._unindex_tile(to_pos)
+    moving_piece = tops[from_pos]
+    below = buried.get(from_pos)
+    if below is not None:
+      key ^= _zobrist_tile(from_pos, len(below), moving_piece)
+      tops[from_pos] = below.pop()
+      if not below:
+        del buried[from_pos]
     else:
-      moving_piece = self.pieces[from_pos]
-      self.pieces[from_pos] = EMPTY
-      if type(self.pieces[to_pos]) is list:
-        self.pieces[to_pos].append(moving_piece)
-      else:
-        if self.pieces[to_pos] == EMPTY:
-          self.pieces[to_pos] = moving_piece
-        else:
-          self.pieces[to_pos] = [self.pieces[to_pos], moving_piece]
-        for neighbour_pos in self.get_neighbouring_tiles(to_pos):
-          if not neighbour_pos in self.pieces:
-            self.pieces[neighbour_pos] = EMPTY
-      for neighbour_pos in self.get_neighbouring_tiles(from_pos):
-        if len(self.get_non_empty_neighbours(neighbour_pos)) == 0:
-          del self.pieces[neighbour_pos]
+      key ^= _zobrist_tile(from_pos, 0, moving_piece) ^ _zobrist_tile(from_pos, 0, EMPTY)
+      tops[from_pos] = EMPTY
+      self._occupy(from_pos, -1)
+    if tops[to_pos] == EMPTY:
+      key ^= _zobrist_tile(to_pos, 0, EMPTY) ^ _zobrist_tile(to_pos, 0, moving_piece)
+      self._occupy(to_pos, 1)
+    else:
+      below = buried.setdefault(to_pos, [])
+      below.append(tops[to_pos])
+      key ^= _zobrist_tile(to_pos, len(below), moving_piece)
+    tops[to_pos] = moving_piece
+    for neighbour_pos in _neighbours(to_pos):
+      if not neighbour_pos in tops:
+        tops[neighbour_pos] = EMPTY
+        key ^= _zobrist_tile(neighbour_pos, 0, EMPTY)
+    if tops[from_pos] == EMPTY:
+      for neighbour_pos in _neighbours(from_pos):
+        if self._degrees.get(neighbour_pos, 0) == 0:
+          key ^= self._tile_hash(neighbour_pos)
+          self._unindex_tile(neighbour_pos)
+          if tops[neighbour_pos] != EMPTY:
+            self._occupy(neighbour_pos, -1)
+            buried.pop(neighbour_pos, None)
+            del tops[neighbour_pos]
+            for pos in _neighbours(neighbour_pos):
+              self._refresh_placement(pos)
+          else:
+            del tops[neighbour_pos]
+    self._index_tile(from_pos)
+    self._index_tile(to_pos)
+    self.position_hash = key
 
   def play_action(self, action, player, step):
     """Play an action if it is valid.
@@ -692,6 +1385,43 @@ class Board:
     """
     if not self.is_action_valid(action, player, step):
       raise InvalidAction(action, player)
+    self._apply_action(action, player)
+    return self
+
+  def apply_trusted(self, action, player, step):
+    """Play an action known to be valid, e.g. one just returned by
+    get_actions for this board, player and step, without checking it.
+    Return self.
+
+    Engines use this path for the actions they generate, untrusted
+    agents go through play_action. With CHECK_TRUSTED (set by the
+    ZOMBIES_CHECK_TRUSTED environment variable), the action is also
+    played with play_action on a copy of the board, which raises
+    InvalidAction if it is invalid, and AssertionError is raised if
+    the two boards differ.
+
+    """
+    strict = self._play_strict(action, player, step)
+    self._apply_action(action, player)
+    self._check_trusted(strict, action)
+    return self
+
+  def _play_strict(self, action, player, step):
+    """Returns a copy of the board on which action has been played
+    with play_action if CHECK_TRUSTED is set, None otherwise."""
+    if not CHECK_TRUSTED:
+      return None
+    return self.clone().play_action(action, player, step)
+
+  def _check_trusted(self, strict, action):
+    """Raises AssertionError if strict, the result of _play_strict,
+    differs from the board."""
+    if strict is not None and strict != self:
+      raise AssertionError("trusted action " + str(action) +
+                           " diverged from play_action")
+
+  def _apply_action(self, action, player):
+    """Play an action without checking that it is valid."""
     kind, (q1, r1), (q2, r2) = action
     if kind == 'P':
       self.place_piece((q1, r1), (q2, r2), player)
@@ -701,19 +1431,80 @@ class Board:
       pass
     else:
       raise InvalidAction(action, player)
-    return self
+    if self.side_to_move != -player:
+      self.position_hash ^= _ZOBRIST_SIDE
+      self.side_to_move = -player
+
+  def do_action(self, action, player, step, trusted=False):
+    """Play an action like play_action and return an undo record.
+
+    Giving the record to undo restores the position as it was
+    before the action, including the unplaced pieces, the hugger
+    stacks and the empty tiles added or removed around the moved
+    piece. Records must be undone in the reverse order of the
+    do_action calls that returned them.
+
+    If trusted is True, the action is not checked, as with
+    apply_trusted.
+
+    """
+    strict = None
+    if trusted:
+      strict = self._play_strict(action, player, step)
+    elif not self.is_action_valid(action, player, step):
+      raise InvalidAction(action, player)
+    kind, from_pos, to_pos = action
+    touched = []
+    unplaced = None
+    if kind == 'P':
+      touched = (to_pos,) + _neighbours(to_pos)
+      unplaced = (from_pos[0], self.unplaced_pieces[from_pos[0]])
+    elif kind == 'M':
+      touched = (from_pos, to_pos) + _neighbours(from_pos) + \
+        _neighbours(to_pos)
+    tiles = []
+    for pos in touched:
+      below = self._buried.get(pos)
+      if below is not None:
+        below = list(below)
+      tiles.append((pos, self._tops.get(pos), below))
+    record = (tiles, unplaced, self.position_hash, self.side_to_move)
+    self._apply_action(action, player)
+    self._check_trusted(strict, action)
+    return record
+
+  def undo(self, record):
+    """Restore the position as it was before the do_action call
+    which returned record."""
+    tiles, unplaced, self.position_hash, self.side_to_move = record
+    for pos, top, below in tiles:
+      current = self._tops.get(pos)
+      self._unindex_tile(pos)
+      was_empty = current is None or current == EMPTY
+      if was_empty != (top is None or top == EMPTY):
+        self._occupy(pos, 1 if was_empty else -1)
+      if below is None:
+        self._buried.pop(pos, None)
+      else:
+        self._buried[pos] = below
+      if top is None:
+        self._tops.pop(pos, None)
+      else:
+        self._tops[pos] = top
+        self._index_tile(pos)
+    if unplaced is not None:
+      piece, qty = unplaced
+      self.unplaced_pieces[piece] = qty
 
   def is_finished(self):
     """Return whether one or both of the necromancers
     are surrounded (i.e. the game is finished).
     """
-    for piece in self.pieces:
-      if (type(self.pieces[piece]) is int and abs(self.pieces[piece]) == NECROMANCER) or \
-        (type(self.pieces[piece]) is list and \
-        (NECROMANCER in self.pieces[piece] or -NECROMANCER in self.pieces[piece])):
-        if len(self.get_non_empty_neighbours(piece)) == 6:
+    for necromancer in (NECROMANCER, -NECROMANCER):
+      for pos in self._locations.get(necromancer, ()):
+        if self._degrees.get(pos, 0) == 6:
           return True
-    return False 
+    return False
 
   def get_score(self, player=PLAYER1):
     """Return a score for this board for the given player.
@@ -725,15 +1516,1289 @@ class Board:
     score = 0
     if self.unplaced_pieces[NECROMANCER * player] == 0 and \
       self.unplaced_pieces[NECROMANCER * -player] == 0:
-      for piece in self.pieces:
-        if (type(self.pieces[piece]) is int and self.pieces[piece] * player == NECROMANCER) or \
-           (type(self.pieces[piece]) is list and NECROMANCER * player in self.pieces[piece]):
-          score -= len(self.get_non_empty_neighbours(piece))
-        elif (type(self.pieces[piece]) is int and self.pieces[piece] * -player == NECROMANCER) or \
-           (type(self.pieces[piece]) is list and NECROMANCER * -player in self.pieces[piece]):
-          score += len(self.get_non_empty_neighbours(piece))
+      for pos in self._locations.get(NECROMANCER * player, ()):
+        score -= self._degrees.get(pos, 0)
+      for pos in self._locations.get(NECROMANCER * -player, ()):
+        score += self._degrees.get(pos, 0)
     return score
 
+# Side of the square grid used by CompactBoard. A hive of 22 pieces
+# and its surrounding empty tiles always fits in it with some margin.
+GRID_SIZE = 32
+# Marker of a grid cell which is not a tile of the board
+NO_TILE = 127
+
+_CELLS = GRID_SIZE * GRID_SIZE
+# Maximum number of pieces under the top of a hugger stack
+_MAX_BURIED = 4
+# Maximum number of copies of a piece
+_MAX_COPIES = 3
+# Layout of the CompactBoard buffer: top piece of each cell, stack
+# depth of each cell, buried pieces of each cell (bottom first),
+# position of each cell in the live list, number of non-empty
+# neighbours of each cell, number of neighbours of each cell holding
+# a piece of PLAYER1 and of PLAYER2, unplaced pieces (indexed by
+# piece), grid origin, side to move, number of live tiles, live
+# tiles and the location index: for each piece, the grid indices
+# plus one of the cells holding its copies (0 for none).
+_DEPTH = _CELLS
+_BURIED = 2 * _CELLS
+_SLOT = _BURIED + _MAX_BURIED * _CELLS
+_DEGREE = _SLOT + _CELLS
+_TOUCH = _DEGREE + _CELLS
+_UNPLACED = _TOUCH + 2 * _CELLS + SPRINTER
+_ORIGIN = _UNPLACED + SPRINTER + 1
+_SIDE = _ORIGIN + 2
+_LIVE_COUNT = _SIDE + 1
+_LIVE = _LIVE_COUNT + 1
+_LOCATIONS = _LIVE + _CELLS + _MAX_COPIES * SPRINTER
+_BUFFER_SIZE = _LOCATIONS + _MAX_COPIES * (SPRINTER + 1)
+
+_BLANK_BUFFER = array.array('h', [NO_TILE] * _CELLS + [0] * (_BUFFER_SIZE - _CELLS))
+_BLANK_BUFFER[_SIDE] = PLAYER1
+
+# Index offsets of the six neighbours of a cell, indexed by direction
+# as _NEIGHBOUR_DELTAS
+_INDEX_DELTAS = tuple(delta_q + GRID_SIZE * delta_r
+  for delta_q, delta_r in _NEIGHBOUR_DELTAS)
+# For each move offset, the index offsets of the two cells of _GATES
+_INDEX_GATES = {}
+for _d, (_left, _right) in enumerate(_GATES):
+  _INDEX_GATES[_INDEX_DELTAS[_d]] = (_INDEX_DELTAS[_left], _INDEX_DELTAS[_right])
+
+# The sort key of _TileKeys of the position of each cell, for the grid
+# origin (128, 128), without the top piece
+_CELL_KEYS = tuple(((i % GRID_SIZE) << 16) + ((i // GRID_SIZE) << 8) for i in range(_CELLS))
+
+
+def _neighbour_counts(*groups):
+  """Returns, for each list of grid indices of groups, an array('h')
+  giving the number of neighbours of each grid index in the list. The
+  cells are counted all at once, as the bytes of an integer holding a
+  lane of one byte per group for each cell, shifted towards each
+  neighbour."""
+  width = len(groups)
+  lanes = bytearray(width * _CELLS)
+  for k, cells in enumerate(groups):
+    for i in cells:
+      lanes[width * i + k] = 1
+  cells = int.from_bytes(lanes, "little")
+  counts = 0
+  for delta in _INDEX_DELTAS:
+    if delta > 0:
+      counts += cells << 8 * width * delta
+    else:
+      counts += cells >> -8 * width * delta
+  counts = counts.to_bytes(width * (_CELLS + GRID_SIZE + 1), "little")
+  # The counts of a group, widened to the 16-bit items of an array
+  low = 0 if sys.byteorder == "little" else 1
+  result = []
+  for k in range(width):
+    items = bytearray(2 * _CELLS)
+    items[low::2] = counts[k:width * _CELLS:width]
+    result.append(array.array('h', []))
+    result[-1].frombytes(items)
+  return result
+
+_STARTING_PIECES = ((NECROMANCER, 1), (HUGGER, 2), (JUMPER, 3), (CREEPER, 2), (SPRINTER, 3))
+
+
+class CompactBoard(Board):
+  """
+  Array-backed representation of a Zombie Board.
+
+  Each (q, r) tile is mapped to an integer index in a fixed-size grid
+  of GRID_SIZE x GRID_SIZE cells which is recentred when the hive
+  drifts towards its border. The whole position (tiles, hugger stacks,
+  unplaced pieces, side to move and the list of live tiles) is kept
+  in one flat array so that cloning is a single buffer copy, next to
+  the Zobrist hash of the position.
+
+  The public API is the one of Board. The pieces and unplaced_pieces
+  attributes are read-only snapshots built on demand.
+
+  """
+
+  def __init__(self, percepts=None, backend=None):
+    """
+    Constructor of the compact representation for a Zombies game.
+    The representation can be initialized by a percepts of any
+    backend, or by the bytes returned by to_bytes. If percepts==None:
+        The board is empty and each player has the starting
+        11 zombie pieces.
+    """
+    if isinstance(percepts, CompactBoard):
+      self._buf = percepts._buf[:]
+      self.position_hash = percepts.position_hash
+      return
+    self._buf = _BLANK_BUFFER[:]
+    buf = self._buf
+    if isinstance(percepts, (bytes, bytearray)):
+      # The hash of the position is computed on first use
+      self._decode(percepts)
+      return
+    if percepts is not None:
+      buf[_SIDE] = getattr(percepts, "side_to_move", PLAYER1)
+      unplaced_pieces = percepts.unplaced_pieces
+      for piece in unplaced_pieces:
+        buf[_UNPLACED + piece] = unplaced_pieces[piece]
+      self._load(percepts.pieces)
+    else:
+      for piece, qty in _STARTING_PIECES:
+        buf[_UNPLACED + piece] = qty
+        buf[_UNPLACED - piece] = qty
+      self._load({(0, 0): EMPTY})
+    self.position_hash = self.compute_hash()
+
+  def _load(self, pieces):
+    """Place the tiles of a pieces dictionary on an empty grid
+    centred on them"""
+    buf = self._buf
+    if pieces:
+      q_coords = [q for (q, r) in pieces]
+      r_coords = [r for (q, r) in pieces]
+      buf[_ORIGIN] = GRID_SIZE // 2 - (min(q_coords) + max(q_coords)) // 2
+      buf[_ORIGIN + 1] = GRID_SIZE // 2 - (min(r_coords) + max(r_coords)) // 2
+    else:
+      buf[_ORIGIN] = buf[_ORIGIN + 1] = GRID_SIZE // 2
+    for pos in pieces:
+      i = self._idx(pos)
+      if i < 0:
+        raise NonExistingTile(pos)
+      if type(pieces[pos]) is list:
+        stack = pieces[pos]
+        self._add_tile(i, stack[-1])
+        for k in range(len(stack) - 1):
+          buf[_BURIED + _MAX_BURIED * i + k] = stack[k]
+        buf[_DEPTH + i] = len(stack) - 1
+        for piece in stack:
+          self._relocate(piece, -1, i)
+      else:
+        self._add_tile(i, pieces[pos])
+        if pieces[pos] != EMPTY and pieces[pos] != NO_TILE:
+          self._relocate(pieces[pos], -1, i)
+    for pos in pieces:
+      if pieces[pos] != EMPTY and pieces[pos] != NO_TILE:
+        i = self._idx(pos)
+        self._occupy(i, 1)
+        self._touch(i, 0, self._owners(i))
+
+  def _decode(self, data):
+    """Place the tiles of the position encoded in data by to_bytes on
+    the empty grid, centred on them, straight from their encoding"""
+    buf = self._buf
+    buf[_SIDE], unplaced, q_coords, r_coords, pieces, stacks = _decode_tiles(data)
+    for piece, qty in zip(_ENCODED_PIECES, unplaced):
+      buf[_UNPLACED + piece] = qty
+    count = len(pieces)
+    origin_q = origin_r = GRID_SIZE // 2
+    if count:
+      low_q, high_q = min(q_coords), max(q_coords)
+      low_r, high_r = min(r_coords), max(r_coords)
+      origin_q -= (low_q + high_q) // 2
+      origin_r -= (low_r + high_r) // 2
+      if low_q + origin_q < 0 or low_r + origin_r < 0:
+        raise NonExistingTile((low_q, low_r))
+      if high_q + origin_q >= GRID_SIZE or high_r + origin_r >= GRID_SIZE:
+        raise NonExistingTile((high_q, high_r))
+    buf[_ORIGIN] = origin_q
+    buf[_ORIGIN + 1] = origin_r
+    cells = [q + origin_q + GRID_SIZE * (r + origin_r) for q, r in zip(q_coords, r_coords)]
+    buf[_LIVE:_LIVE + count] = array.array('h', cells)
+    buf[_LIVE_COUNT] = count
+    for slot in range(count):
+      i = cells[slot]
+      if buf[i] != NO_TILE:
+        raise ValueError("invalid board encoding")
+      buf[i] = pieces[slot]
+      buf[_SLOT + i] = slot
+    for pos, below in stacks:
+      i = self._tile(pos)
+      if i < 0 or buf[i] == EMPTY or len(below) > _MAX_BURIED or buf[_DEPTH + i]:
+        raise ValueError("invalid board encoding")
+      base = _BURIED + _MAX_BURIED * i
+      buf[base:base + len(below)] = array.array('h', below)
+      buf[_DEPTH + i] = len(below)
+      for piece in below:
+        self._relocate(piece, -1, i)
+    occupied = []
+    owned = ([], [])
+    for i in cells:
+      top = buf[i]
+      if top != EMPTY:
+        self._relocate(top, -1, i)
+        occupied.append(i)
+        owners = self._owners(i) if buf[_DEPTH + i] else 1 if top > 0 else 2
+        if owners & 1:
+          owned[0].append(i)
+        if owners & 2:
+          owned[1].append(i)
+    degrees, touching1, touching2 = _neighbour_counts(occupied, *owned)
+    buf[_DEGREE:_DEGREE + _CELLS] = degrees
+    buf[_TOUCH:_TOUCH + _CELLS] = touching1
+    buf[_TOUCH + _CELLS:_TOUCH + 2 * _CELLS] = touching2
+
+  @property
+  def pieces(self):
+    """Snapshot of the tiles in the format of Board.pieces"""
+    pieces = {}
+    for i in self._live():
+      pieces[self._pos(i)] = self._stack(i) if self._buf[_DEPTH + i] else self._buf[i]
+    return pieces
+
+  def _tables(self):
+    buf = self._buf
+    tops = {}
+    buried = {}
+    for i in self._live():
+      pos = self._pos(i)
+      tops[pos] = buf[i]
+      if buf[_DEPTH + i]:
+        buried[pos] = self._stack(i)[:-1]
+    return tops, buried
+
+  def _tiles(self):
+    buf = self._buf
+    live = self._live()
+    pos = self._pos
+    return [pos(i) for i in live], [buf[i] for i in live], \
+      [(pos(i), self._stack(i)[:-1]) for i in live if buf[_DEPTH + i]]
+
+  def _unplaced_counts(self):
+    buf = self._buf
+    return [buf[_UNPLACED + piece] for piece in _ENCODED_PIECES]
+
+  def to_bytes(self):
+    buf = self._buf
+    origin_q = buf[_ORIGIN]
+    origin_r = buf[_ORIGIN + 1]
+    if not (-96 < origin_q <= 128 and -96 < origin_r <= 128):
+      # Some cells of the grid have a coordinate which does not fit in
+      # a byte
+      return Board.to_bytes(self)
+    # The keys of _TileKeys of the tiles, from their grid indices
+    shift = ((128 - origin_q) << 16) + ((128 - origin_r) << 8) + 128
+    live = self._live()
+    keys = sorted([_CELL_KEYS[i] + buf[i] + shift for i in live])
+    buried = {self._pos(i): self._stack(i)[:-1] for i in live if buf[_DEPTH + i]}
+    return _encode_keys(buf[_SIDE], self._unplaced_counts(), 0, 0, keys, buried)
+
+  def __getstate__(self):
+    # The buffer holds the indexes, pickled with it
+    return self.__dict__
+
+  @property
+  def unplaced_pieces(self):
+    """Snapshot of the unplaced pieces in the format of
+    Board.unplaced_pieces"""
+    unplaced_pieces = {}
+    for player in (PLAYER1, PLAYER2):
+      for piece, qty in _STARTING_PIECES:
+        unplaced_pieces[player * piece] = self._buf[_UNPLACED + player * piece]
+    return unplaced_pieces
+
+  @property
+  def side_to_move(self):
+    return self._buf[_SIDE]
+
+  @side_to_move.setter
+  def side_to_move(self, player):
+    self._buf[_SIDE] = player
+
+  def _idx(self, pos):
+    """Returns the grid index of pos, or -1 if pos lies outside
+    the grid"""
+    q, r = pos
+    q += self._buf[_ORIGIN]
+    r += self._buf[_ORIGIN + 1]
+    if 0 <= q < GRID_SIZE and 0 <= r < GRID_SIZE:
+      return q + r * GRID_SIZE
+    return -1
+
+  def _pos(self, i):
+    """Returns the hex position of grid index i"""
+    return (i % GRID_SIZE - self._buf[_ORIGIN], i // GRID_SIZE - self._buf[_ORIGIN + 1])
+
+  def _tile(self, pos):
+    """Returns the grid index of the tile at pos, or -1 if there
+    is no such tile"""
+    i = self._idx(pos)
+    if i < 0 or self._buf[i] == NO_TILE:
+      return -1
+    return i
+
+  def _live(self):
+    """Returns the grid indices of all the tiles of the board"""
+    return self._buf[_LIVE:_LIVE + self._buf[_LIVE_COUNT]]
+
+  def _stack(self, i):
+    """Returns the pieces at grid index i, bottom first"""
+    buf = self._buf
+    base = _BURIED + _MAX_BURIED * i
+    return list(buf[base:base + buf[_DEPTH + i]]) + [buf[i]]
+
+  def _add_tile(self, i, piece):
+    buf = self._buf
+    n = buf[_LIVE_COUNT]
+    buf[_LIVE + n] = i
+    buf[_SLOT + i] = n
+    buf[_LIVE_COUNT] = n + 1
+    buf[i] = piece
+
+  def _occupy(self, i, count):
+    """Board._occupy() with grid indices"""
+    buf = self._buf
+    for delta in _INDEX_DELTAS:
+      buf[_DEGREE + i + delta] += count
+
+  def _owners(self, i):
+    """Returns the players having a piece at grid index i, as a mask
+    of 1 for PLAYER1 and 2 for PLAYER2"""
+    buf = self._buf
+    mask = 0
+    base = _BURIED + _MAX_BURIED * i
+    for k in range(base, base + buf[_DEPTH + i]):
+      mask |= 1 if buf[k] > 0 else 2
+    if buf[i] != EMPTY and buf[i] != NO_TILE:
+      mask |= 1 if buf[i] > 0 else 2
+    return mask
+
+  def _touch(self, i, before, after):
+    """Updates the counts of neighbours holding a piece of each player
+    around grid index i, whose owners (see _owners) change from before
+    to after"""
+    buf = self._buf
+    for bit, base in ((1, _TOUCH), (2, _TOUCH + _CELLS)):
+      if (before ^ after) & bit:
+        count = 1 if after & bit else -1
+        for delta in _INDEX_DELTAS:
+          buf[base + i + delta] += count
+
+  def occupied_degree(self, pos):
+    i = self._idx(pos)
+    if i < 0:
+      return 0
+    return self._buf[_DEGREE + i]
+
+  def _relocate(self, piece, i, j):
+    """Moves a copy of piece from grid index i to grid index j in the
+    location index, i being -1 to add a copy and j -1 to remove it"""
+    buf = self._buf
+    base = _LOCATIONS + _MAX_COPIES * piece
+    for k in range(base, base + _MAX_COPIES):
+      if buf[k] == i + 1:
+        buf[k] = j + 1
+        return
+
+  def _located(self, piece):
+    """Returns the grid indices of the cells holding piece"""
+    base = _LOCATIONS + _MAX_COPIES * piece
+    return [k - 1 for k in self._buf[base:base + _MAX_COPIES] if k]
+
+  def locate(self, piece):
+    pos = self._pos
+    return set(pos(i) for i in self._located(piece))
+
+  def necromancer_pos(self, player):
+    for i in self._located(player * NECROMANCER):
+      return self._pos(i)
+    return None
+
+  def _remove_tile(self, i):
+    buf = self._buf
+    n = buf[_LIVE_COUNT] - 1
+    slot = buf[_SLOT + i]
+    last = buf[_LIVE + n]
+    buf[_LIVE + slot] = last
+    buf[_SLOT + last] = slot
+    buf[_LIVE_COUNT] = n
+    buf[i] = NO_TILE
+    buf[_SLOT + i] = 0
+    base = _BURIED + _MAX_BURIED * i
+    for k in range(buf[_DEPTH + i]):
+      buf[base + k] = 0
+    buf[_DEPTH + i] = 0
+
+  def _reserve(self, pos):
+    """Returns the grid index of pos, creating an empty tile there
+    if needed. The grid is recentred first if the neighbours of pos
+    would not fit in it."""
+    q, r = pos
+    buf = self._buf
+    grid_q = q + buf[_ORIGIN]
+    grid_r = r + buf[_ORIGIN + 1]
+    if not (2 <= grid_q < GRID_SIZE - 2 and 2 <= grid_r < GRID_SIZE - 2):
+      self._recentre(pos)
+      buf = self._buf
+      grid_q = q + buf[_ORIGIN]
+      grid_r = r + buf[_ORIGIN + 1]
+    i = grid_q + grid_r * GRID_SIZE
+    if buf[i] == NO_TILE:
+      self._add_tile(i, EMPTY)
+    return i
+
+  def _recentre(self, pos):
+    """Rebuilds the grid centred on the tiles of the board and pos"""
+    pieces = self.pieces
+    if not pos in pieces:
+      pieces[pos] = NO_TILE
+    old_buf = self._buf
+    self._buf = _BLANK_BUFFER[:]
+    self._buf[_UNPLACED - SPRINTER:_ORIGIN] = old_buf[_UNPLACED - SPRINTER:_ORIGIN]
+    self._buf[_SIDE] = old_buf[_SIDE]
+    self._load(pieces)
+    i = self._idx(pos)
+    if self._buf[i] == NO_TILE:
+      self._remove_tile(i)
+
+  def _add_frontier(self, i):
+    """Adds the missing empty tiles around grid index i and returns
+    their Zobrist hash"""
+    buf = self._buf
+    key = 0
+    for delta in _INDEX_DELTAS:
+      if buf[i + delta] == NO_TILE:
+        self._add_tile(i + delta, EMPTY)
+        key ^= _zobrist_tile(self._pos(i + delta), 0, EMPTY)
+    return key
+
+  def _tile_hash(self, i):
+    """Returns the Zobrist hash of the tile at grid index i"""
+    pos = self._pos(i)
+    stack = self._stack(i)
+    key = 0
+    for level in range(len(stack)):
+      key ^= _zobrist_tile(pos, level, stack[level])
+    return key
+
+  def _non_empty_neighbours(self, i):
+    buf = self._buf
+    non_empty_neighbours = []
+    for delta in _INDEX_DELTAS:
+      piece = buf[i + delta]
+      if piece != EMPTY and piece != NO_TILE:
+        non_empty_neighbours.append(i + delta)
+    return non_empty_neighbours
+
+  def _is_isolated(self, i, orig):
+    buf = self._buf
+    return buf[_DEGREE + i] == 1 and orig - i in _INDEX_GATES and \
+      buf[orig] != EMPTY and buf[orig] != NO_TILE
+
+  def _respects_move_liberty(self, i, j):
+    buf = self._buf
+    if buf[j] != EMPTY:
+      return False
+    gate = _INDEX_GATES.get(j - i)
+    if gate is None:
+      return False
+    left = buf[i + gate[0]]
+    right = buf[i + gate[1]]
+    return left == EMPTY or left == NO_TILE or right == EMPTY or right == NO_TILE
+
+  def _is_connected_without(self, i):
+    buf = self._buf
+    if buf[_DEPTH + i]:
+      return True
+    points, groups = self._articulation_indices()
+    if buf[i] == EMPTY:
+      return groups <= 1
+    if groups == 1:
+      return not i in points
+    return groups == 2 and not buf[_DEGREE + i]
+
+  def _articulation_indices(self):
+    """Returns get_articulation_points() with grid indices, cached per
+    position and grid origin"""
+    buf = self._buf
+    key = (self.position_hash, buf[_ORIGIN], buf[_ORIGIN + 1])
+    cache = self._articulation
+    if cache is None or cache[0] != key:
+      occupied = set()
+      for j in self._live():
+        piece = buf[j]
+        if piece != EMPTY and piece != NO_TILE:
+          occupied.add(j)
+      points, groups = _articulation_points(
+        occupied, lambda j: [j + delta for delta in _INDEX_DELTAS])
+      cache = self._articulation = (key, points, groups)
+    return cache[1], cache[2]
+
+  def get_articulation_points(self):
+    pos = self._pos
+    points, groups = self._articulation_indices()
+    return set(pos(i) for i in points), groups
+
+  def _steps(self, i, orig):
+    """Returns the tiles reachable from grid index i in one step
+    respecting the move liberty, for the piece coming from orig"""
+    steps = []
+    for delta in _INDEX_DELTAS:
+      if self._respects_move_liberty(i, i + delta) and \
+        not self._is_isolated(i + delta, orig):
+        steps.append(i + delta)
+    return steps
+
+  def _necromancer_moves(self, i):
+    buf = self._buf
+    necro_moves = []
+    for delta in _INDEX_DELTAS:
+      j = i + delta
+      if buf[j] == EMPTY and self._respects_move_liberty(i, j) and \
+        not self._is_isolated(j, i):
+        necro_moves.append(j)
+    return necro_moves
+
+  def _hugger_moves(self, i):
+    if self._buf[_DEPTH + i]:
+      return [i + delta for delta in _INDEX_DELTAS]
+    return [i + delta for delta in _INDEX_DELTAS if not self._is_isolated(i + delta, i)]
+
+  def _jumper_moves(self, i):
+    buf = self._buf
+    jumper_moves = []
+    for delta in _INDEX_DELTAS:
+      j = i + delta
+      while buf[j] != EMPTY and buf[j] != NO_TILE:
+        j += delta
+      if j != i + delta:
+        jumper_moves.append(j)
+    return jumper_moves
+
+  def _creeper_moves(self, i):
+    return list(self._triple_moves(i))
+
+  def _triple_moves(self, i):
+    """Returns Board._triple_moves() with grid indices, cached per
+    position and grid origin"""
+    buf = self._buf
+    key = (self.position_hash, buf[_ORIGIN], buf[_ORIGIN + 1])
+    cache = self._creeper
+    if cache is None or cache[0] != key:
+      cache = self._creeper = (key, {})
+    ends = cache[1].get(i)
+    if ends is None:
+      ends = cache[1][i] = {}
+      steps = {}
+      path = []
+      stack = [(i, 0)]
+      while stack:
+        j, depth = stack.pop()
+        del path[depth:]
+        path.append(j)
+        if depth == 3:
+          ends[j] = None
+          continue
+        next_steps = steps.get(j)
+        if next_steps is None:
+          next_steps = steps[j] = [k for k in
+            reversed(self._steps(j, i))]
+        for k in next_steps:
+          if not k in path:
+            stack.append((k, depth + 1))
+    return ends
+
+  def _sprinter_moves(self, i):
+    return self._reachable(i)
+
+  def _reachable(self, i, avoid_isolated=True):
+    """Returns reachable_tiles() with grid indices"""
+    distances = self._traverse(i, avoid_isolated)[0]
+    return [j for j in distances if j != i]
+
+  def _traverse(self, i, avoid_isolated):
+    """Returns Board._traverse() with grid indices, cached per position
+    and grid origin"""
+    buf = self._buf
+    key = (self.position_hash, buf[_ORIGIN], buf[_ORIGIN + 1])
+    cache = self._reachability
+    if cache is None or cache[0] != key:
+      cache = self._reachability = (key, {})
+    traversal = cache[1].get((i, avoid_isolated))
+    if traversal is None:
+      distances = {i: 0}
+      predecessors = {i: None}
+      queue = collections.deque([i])
+      while queue:
+        j = queue.popleft()
+        for delta in _INDEX_DELTAS:
+          k = j + delta
+          if not k in distances and buf[k] == EMPTY and \
+            self._respects_move_liberty(j, k) and \
+            not (avoid_isolated and self._is_isolated(k, i)):
+            distances[k] = distances[j] + 1
+            predecessors[k] = j
+            queue.append(k)
+      traversal = cache[1][(i, avoid_isolated)] = (distances, predecessors)
+    return traversal
+
+  def _piece_moves(self, i, piece_type):
+    """Returns the grid indices reachable by the piece of the given
+    type at grid index i"""
+    if not self._is_connected_without(i):
+      return []
+    if piece_type == NECROMANCER:
+      return self._necromancer_moves(i)
+    elif piece_type == HUGGER:
+      return self._hugger_moves(i)
+    elif piece_type == JUMPER:
+      return self._jumper_moves(i)
+    elif piece_type == CREEPER:
+      return self._creeper_moves(i)
+    elif piece_type == SPRINTER:
+      return self._sprinter_moves(i)
+    return []
+
+  def _possible_placements(self, player, step):
+    buf = self._buf
+    if step <= 2:
+      return [i for i in self._live() if buf[i] == EMPTY]
+    mine = _TOUCH if player == PLAYER1 else _TOUCH + _CELLS
+    theirs = _TOUCH + _CELLS if player == PLAYER1 else _TOUCH
+    return [i for i in self._live()
+      if buf[i] == EMPTY and buf[mine + i] and not buf[theirs + i]]
+
+  def tile_str(self, q, r):
+    """String representation of a tile on the board"""
+    stack = self._stack(self._tile((q, r)))
+    names = []
+    for piece in stack:
+      name = PIECE_NAMES[abs(piece)]
+      if piece < 0:
+        name += " (P2)"
+      elif piece > 0:
+        name += " (P1)"
+      names.append(name)
+    if len(stack) == 1:
+      return names[0]
+    return "[" + ", ".join(names) + "]"
+
+  def clone(self):
+    """Return a clone of this object."""
+    clone_board = CompactBoard.__new__(CompactBoard)
+    clone_board._buf = self._buf[:]
+    clone_board.position_hash = self.position_hash
+    return clone_board
+
+  def is_move_valid(self, former_pos, new_pos, player):
+    """Returns true if the player can move piece from
+    former_pos to new_pos"""
+    buf = self._buf
+    former_q, former_r = former_pos
+    new_q, new_r = new_pos
+    if buf[_UNPLACED + player * NECROMANCER] != 0:
+      return False
+    i = self._tile(former_pos)
+    j = self._tile(new_pos)
+    if i < 0 or j < 0:
+      return False
+    if not self._is_connected_without(i) or \
+      (not buf[_DEPTH + i] and self._is_isolated(j, i)):
+      return False
+    piece_type = buf[i] * player
+    if piece_type <= 0:
+      return False
+    if piece_type == NECROMANCER:
+      return (new_q != former_q or new_r != former_r) and abs(new_q - former_q) <= 1 and \
+        abs(new_r - former_r) <= 1 and buf[j] == EMPTY and \
+        self._respects_move_liberty(i, j)
+    if piece_type == HUGGER:
+      return former_pos != new_pos and abs(new_q - former_q) <= 1 and \
+        abs(new_r - former_r) <= 1
+    if piece_type == JUMPER:
+      return self.jumps_in_line(former_pos, new_pos)
+    if piece_type == CREEPER:
+      return self.is_triple_move_correct(former_pos, new_pos)
+    if piece_type == SPRINTER:
+      return self.is_multi_tile_move_correct(former_pos, new_pos)
+
+  def _moves_of(self, pos, piece_type):
+    i = self._tile(pos)
+    if i < 0:
+      raise NonExistingTile(pos)
+    return [self._pos(j) for j in self._piece_moves(i, piece_type)]
+
+  def get_necromancer_moves(self, necro_pos):
+    """Returns a list of the new positions that can be attained
+    by the necromancer currently placed at necro_pos"""
+    return self._moves_of(necro_pos, NECROMANCER)
+
+  def get_hugger_moves(self, hugger_pos):
+    """Returns a list of the new positions that can be attained
+    by the hugger zombie currently placed at hugger_pos"""
+    return self._moves_of(hugger_pos, HUGGER)
+
+  def get_jumper_moves(self, jumper_pos):
+    """Returns a list of the new positions that can be attained
+    by the jumper zombie currently placed at jumper_pos"""
+    return self._moves_of(jumper_pos, JUMPER)
+
+  def get_creeper_moves(self, creeper_pos):
+    """Returns a list of the new positions that can be attained
+    by the creeper zombie currently placed at creeper_pos"""
+    return self._moves_of(creeper_pos, CREEPER)
+
+  def get_sprinter_moves(self, sprinter_pos):
+    """Returns a list of the new positions that can be attained
+    by the sprinter zombie currently placed at sprinter_pos"""
+    return self._moves_of(sprinter_pos, SPRINTER)
+
+  def jumps_in_line(self, from_pos, to_pos):
+    """Returns True if the line between from_pos and to_pos
+    intersects perpendicularly the tile edges and only
+    crosses non-empty tiles; False otherwise"""
+    from_q, from_r = from_pos
+    to_q, to_r = to_pos
+    delta_q = to_q - from_q
+    delta_r = to_r - from_r
+    mult_factor = max(abs(delta_q), abs(delta_r))
+    for dir_q, dir_r in _NEIGHBOUR_DELTAS:
+      if mult_factor * dir_q == delta_q and \
+        mult_factor * dir_r == delta_r:
+        for i in range(1, mult_factor):
+          if self._tile((from_q + i * dir_q, from_r + i * dir_r)) < 0:
+            return False
+        return True
+    return False
+
+  def is_triple_move_correct(self, from_pos, to_pos):
+    """Returns True if there exists a path of empty tiles
+    of length 3 between from_pos and to_pos such that it
+    respects move liberty and doesn't go back on its own step;
+    False otherwise"""
+    j = self._tile(to_pos)
+    if j < 0 or self._buf[j] != EMPTY:
+      return False
+    return j in self._triple_moves(self._tile(from_pos))
+
+  def find_all_paths_of_size(self, start_pos, size, orig_pos, path=[]):
+    """Returns a list containing all the paths of the given size
+    between start_pos and any position such that they respect
+    move liberty and don't go back on their own step"""
+    path = path + [start_pos]
+    if len(path) == size + 1:
+      return [path]
+    i = self._tile(start_pos)
+    orig = self._tile(orig_pos)
+    paths = []
+    for j in self._steps(i, orig):
+      new_pos = self._pos(j)
+      if not new_pos in path:
+        paths += self.find_all_paths_of_size(new_pos, size, orig_pos, path)
+    return paths
+
+  def is_multi_tile_move_correct(self, from_pos, to_pos):
+    """Returns True if there exists a path of empty tiles
+    between from_pos and to_pos such that it respects move
+    liberty and doesn't go back on its own step;
+    False otherwise"""
+    i = self._tile(from_pos)
+    if i < 0:
+      raise NonExistingTile(from_pos)
+    j = self._tile(to_pos)
+    if j < 0:
+      raise NonExistingTile(to_pos)
+    if self._buf[j] != EMPTY or not self._is_connected_without(i):
+      return False
+    return j != i and j in self._traverse(i, False)[0]
+
+  def reachable_tiles(self, from_pos, avoid_isolated=True):
+    i = self._tile(from_pos)
+    if i < 0:
+      raise NonExistingTile(from_pos)
+    pos = self._pos
+    return [pos(j) for j in self._reachable(i, avoid_isolated)]
+
+  def get_distances(self, from_pos, avoid_isolated=True):
+    i = self._tile(from_pos)
+    if i < 0:
+      raise NonExistingTile(from_pos)
+    pos = self._pos
+    distances = self._traverse(i, avoid_isolated)[0]
+    return {pos(j): d for j, d in distances.items()}
+
+  def get_shortest_path(self, start_pos, end_pos):
+    """Returns a shortest path between start_pos and end_pos
+    such that every move performed respects the move liberty."""
+    if start_pos == end_pos:
+      return []
+    start = self._tile(start_pos)
+    if start < 0:
+      raise NonExistingTile(start_pos)
+    end = self._tile(end_pos)
+    predecessors = self._traverse(start, False)[1]
+    if end < 0 or not end in predecessors:
+      raise NoPath()
+    path = []
+    i = end
+    while i != start:
+      path.append(self._pos(i))
+      i = predecessors[i]
+    path.reverse()
+    return path
+
+  def pieces_are_connected_without(self, piece_pos_moving):
+    """Returns True if the pieces are still connected without
+    the (top) piece positioned at piece_pos_moving"""
+    i = self._tile(piece_pos_moving)
+    if i < 0:
+      raise NonExistingTile(piece_pos_moving)
+    return self._is_connected_without(i)
+
+  def is_position_isolated(self, new_pos, orig_pos):
+    """Returns True if new_pos has no non-empty neighbour or
+    that its only neighbour is orig_pos; False otherwise"""
+    non_empty_neighbours = self.get_non_empty_neighbours(new_pos)
+    return len(non_empty_neighbours) == 1 and \
+      non_empty_neighbours[0] == orig_pos
+
+  def respects_move_liberty(self, pos1, pos2):
+    """Returns True if moving a piece from pos1 to pos2 respects
+    the move liberty; False otherwise"""
+    i = self._tile(pos1)
+    if i < 0:
+      raise NonExistingTile(pos1)
+    j = self._tile(pos2)
+    if j < 0:
+      raise NonExistingTile(pos2)
+    return self._respects_move_liberty(i, j)
+
+  def get_non_empty_neighbours(self, pos):
+    """Returns a list of all the non-empty hex positions
+    adjacent to pos"""
+    return [neighbour_pos for neighbour_pos in self.get_neighbouring_tiles(pos)
+      if self._tile(neighbour_pos) >= 0 and self._buf[self._tile(neighbour_pos)] != EMPTY]
+
+  def get_empty_tiles(self):
+    """Returns all hex positions of the empty tiles"""
+    return [self._pos(i) for i in self._live() if self._buf[i] == EMPTY]
+
+  def is_placement_valid(self, piece_desc, position, player, step):
+    """Returns True if the unplaced piece described by piece_desc
+    can be placed at position; False otherwise"""
+    (piece, qty) = piece_desc
+    if piece * player < 0 or qty < 1 or \
+      not (0 < abs(piece) <= SPRINTER) or \
+      self._buf[_UNPLACED + piece] != qty or \
+      self._tile(position) < 0:
+      return False
+    if step <= 2:
+      return True
+    i = self._tile(position)
+    if self._buf[i] == EMPTY:
+      mine = _TOUCH if player == PLAYER1 else _TOUCH + _CELLS
+      theirs = _TOUCH + _CELLS if player == PLAYER1 else _TOUCH
+      return self._buf[mine + i] > 0 and not self._buf[theirs + i]
+    non_empty_neighbours = self._non_empty_neighbours(i)
+    for neighbour in non_empty_neighbours:
+      for piece in self._stack(neighbour):
+        if piece * player < 0:
+          return False
+    return len(non_empty_neighbours) > 0
+
+  def get_possible_placements(self, player, step):
+    """Returns all hex positions at which player can place a piece"""
+    return [self._pos(i) for i in self._possible_placements(player, step)]
+
+  def iter_actions(self, player, step, order=None):
+    buf = self._buf
+    pos = self._pos
+    necromancer = player * NECROMANCER
+    targets = None
+    found = False
+    if (step == 7 or step == 8) and buf[_UNPLACED + necromancer] > 0:
+      piece_desc = (necromancer, buf[_UNPLACED + necromancer])
+      for i in self._possible_placements(player, step):
+        found = True
+        yield ('P', piece_desc, pos(i))
+      if not found:
+        yield ('S', (0, 0), (0, 0))
+      return
+    kinds = [None]
+    if order is not None:
+      kinds = list(order) + [kind for kind in range(NECROMANCER, SPRINTER + 1)
+                             if not kind in order]
+    for kind in kinds:
+      for piece_type, qty in _STARTING_PIECES:
+        piece = player * piece_type
+        if buf[_UNPLACED + piece] > 0 and (kind is None or piece_type == kind):
+          if targets is None:
+            targets = [pos(i) for i in self._possible_placements(player, step)]
+          piece_desc = (piece, buf[_UNPLACED + piece])
+          for target in targets:
+            found = True
+            yield ('P', piece_desc, target)
+      if buf[_UNPLACED + necromancer] == 0:
+        for i in self._live():
+          piece_type = buf[i] * player
+          if 0 < piece_type <= SPRINTER and (kind is None or piece_type == kind):
+            former_pos = pos(i)
+            for j in self._piece_moves(i, piece_type):
+              found = True
+              yield ('M', former_pos, pos(j))
+    if not found:
+      yield ('S', (0, 0), (0, 0))
+
+  def do_action(self, action, player, step, trusted=False):
+    """Play an action like play_action and return an undo record.
+
+    The record holds the previous buffer, so undo is a plain swap.
+
+    """
+    strict = None
+    if trusted:
+      strict = self._play_strict(action, player, step)
+    elif not self.is_action_valid(action, player, step):
+      raise InvalidAction(action, player)
+    record = (self._buf, self.position_hash)
+    self._buf = self._buf[:]
+    self._apply_action(action, player)
+    self._check_trusted(strict, action)
+    return record
+
+  def undo(self, record):
+    """Restore the position as it was before the do_action call
+    which returned record."""
+    self._buf, self.position_hash = record
+
+  def is_action_valid(self, action, player, step):
+    """Returns True if the action played by player
+    is valid; False otherwise.
+    """
+    kind, (q1, r1), (q2, r2) = action
+    #Each player must play its necromancer before its fourth turn
+    if (step == 7 or step == 8) and \
+      self._buf[_UNPLACED + player * NECROMANCER] > 0 and \
+      (kind != 'P' or q1 != player * NECROMANCER):
+      return False
+    if kind == 'P':
+      return self.is_placement_valid((q1, r1), (q2, r2), player, step)
+    elif kind == 'M':
+      return self.is_move_valid((q1, r1), (q2, r2), player)
+    elif kind == 'S':
+      possible_actions = self.get_actions(player, step)
+      return len(possible_actions) == 1 and possible_actions[0][0] == 'S'
+    else:
+      return False
+
+  def place_piece(self, piece_desc, to_pos, player):
+    """Changes the board by placing the unplaced piece
+    described by piece_desc at position to_pos.
+    """
+    (piece, qty) = piece_desc
+    key = self.position_hash
+    if self._tile(to_pos) >= 0:
+      key ^= self._tile_hash(self._tile(to_pos))
+    i = self._reserve(to_pos)
+    buf = self._buf
+    if buf[i] != EMPTY:
+      for previous in self._stack(i):
+        self._relocate(previous, i, -1)
+    self._relocate(piece, -1, i)
+    self._touch(i, self._owners(i), 1 if piece > 0 else 2)
+    key ^= _zobrist_unplaced(piece, buf[_UNPLACED + piece]) ^ _zobrist_unplaced(piece, qty - 1)
+    buf[_UNPLACED + piece] = qty - 1
+    base = _BURIED + _MAX_BURIED * i
+    for k in range(buf[_DEPTH + i]):
+      buf[base + k] = 0
+    buf[_DEPTH + i] = 0
+    if buf[i] == EMPTY:
+      self._occupy(i, 1)
+    buf[i] = piece
+    key ^= _zobrist_tile(to_pos, 0, piece)
+    self.position_hash = key ^ self._add_frontier(i)
+
+  def move_piece(self, from_pos, to_pos, player):
+    """Changes the board by moving the (top) piece at from_pos
+    to to_pos.
+    """
+    j = self._reserve(to_pos)
+    i = self._idx(from_pos)
+    buf = self._buf
+    key = self.position_hash
+    moving_piece = buf[i]
+    self._relocate(moving_piece, i, j)
+    from_owners = self._owners(i)
+    to_owners = self._owners(j)
+    from_depth = buf[_DEPTH + i]
+    if from_depth:
+      slot = _BURIED + _MAX_BURIED * i + from_depth - 1
+      buf[i] = buf[slot]
+      buf[slot] = 0
+      buf[_DEPTH + i] = from_depth - 1
+      key ^= _zobrist_tile(from_pos, from_depth, moving_piece)
+    else:
+      buf[i] = EMPTY
+      self._occupy(i, -1)
+      key ^= _zobrist_tile(from_pos, 0, moving_piece) ^ _zobrist_tile(from_pos, 0, EMPTY)
+    to_depth = buf[_DEPTH + j]
+    if to_depth or buf[j] != EMPTY:
+      if to_depth == _MAX_BURIED:
+        raise InvalidAction(('M', from_pos, to_pos), player)
+      buf[_BURIED + _MAX_BURIED * j + to_depth] = buf[j]
+      buf[_DEPTH + j] = to_depth + 1
+      key ^= _zobrist_tile(to_pos, to_depth + 1, moving_piece)
+    else:
+      key ^= _zobrist_tile(to_pos, 0, EMPTY) ^ _zobrist_tile(to_pos, 0, moving_piece)
+      self._occupy(j, 1)
+    buf[j] = moving_piece
+    self._touch(i, from_owners, self._owners(i))
+    self._touch(j, to_owners, self._owners(j))
+    if not to_depth:
+      key ^= self._add_frontier(j)
+    if not from_depth:
+      for delta in _INDEX_DELTAS:
+        if buf[i + delta] != NO_TILE and not buf[_DEGREE + i + delta]:
+          key ^= self._tile_hash(i + delta)
+          self._remove_tile(i + delta)
+    self.position_hash = key
+
+  def is_finished(self):
+    """Return whether one or both of the necromancers
+    are surrounded (i.e. the game is finished).
+    """
+    buf = self._buf
+    for i in self._located(NECROMANCER) + self._located(-NECROMANCER):
+      if buf[_DEGREE + i] == 6:
+        return True
+    return False
+
+  def get_score(self, player=PLAYER1):
+    """Return a score for this board for the given player.
+
+    The score is the difference between the number of adjacent pieces
+    to the necromancer opponent and those adjacent to the necromancer
+    of player.
+    """
+    buf = self._buf
+    score = 0
+    if buf[_UNPLACED + NECROMANCER * player] == 0 and \
+      buf[_UNPLACED - NECROMANCER * player] == 0:
+      for i in self._located(NECROMANCER * player):
+        score -= buf[_DEGREE + i]
+      for i in self._located(-NECROMANCER * player):
+        score += buf[_DEGREE + i]
+    return score
+
+
+# Number of shared layers an _Overlay reads through before it is
+# merged into a single one
+_OVERLAY_DEPTH = 4
+# Marker of a key removed from an _Overlay, or of a missing key
+_DELETED = object()
+
+
+class _Overlay(collections.abc.MutableMapping):
+  """Dict whose copies share their entries.
+
+  The mapping keeps the entries changed since it was last forked, on
+  top of a chain of frozen layers holding the older entries, shared
+  with its forks. With copy, e.g. list, the values are mutable: a
+  value read from a frozen layer is first copied into the mapping.
+  """
+
+  __slots__ = ("_changes", "_parent", "_depth", "_copy")
+
+  def __init__(self, entries=None, copy=None):
+    self._changes = dict(entries) if entries is not None else {}
+    self._parent = None
+    self._depth = 0
+    self._copy = copy
+
+  def __reduce__(self):
+    return (type(self), (self._merged(), self._copy))
+
+  def _layer(self, changes, parent, depth):
+    layer = object.__new__(type(self))
+    layer._changes = changes
+    layer._parent = parent
+    layer._depth = depth
+    layer._copy = self._copy
+    return layer
+
+  def fork(self):
+    """Returns a copy of the mapping. The entries of both are frozen in
+    a layer which they share; the layers are merged past
+    _OVERLAY_DEPTH of them."""
+    if self._depth >= _OVERLAY_DEPTH:
+      self._changes = self._merged()
+      self._parent = None
+      self._depth = 0
+    if self._changes:
+      self._parent = self._layer(self._changes, self._parent, self._depth)
+      self._changes = {}
+      self._depth += 1
+    return self._layer({}, self._parent, self._depth)
+
+  def _merged(self):
+    """Returns a dict of the entries of the mapping"""
+    if self._parent is None:
+      return dict(self._changes)
+    layers = []
+    layer = self
+    while layer is not None:
+      layers.append(layer._changes)
+      layer = layer._parent
+    merged = {}
+    for changes in reversed(layers):
+      merged.update(changes)
+    return {key: value for key, value in merged.items() if value is not _DELETED}
+
+  def _find(self, key):
+    """Returns the value of key, or _DELETED if there is none"""
+    value = self._changes.get(key, self)
+    if value is not self:
+      return value
+    layer = self._parent
+    while layer is not None:
+      value = layer._changes.get(key, layer)
+      if value is not layer:
+        if value is not _DELETED and self._copy is not None:
+          value = self._changes[key] = self._copy(value)
+        return value
+      layer = layer._parent
+    return _DELETED
+
+  def __getitem__(self, key):
+    value = self._find(key)
+    if value is _DELETED:
+      raise KeyError(key)
+    return value
+
+  def get(self, key, default=None):
+    # _find inlined, as the board reads its tables through get
+    value = self._changes.get(key, self)
+    if value is self:
+      layer = self._parent
+      while layer is not None:
+        value = layer._changes.get(key, layer)
+        if value is not layer:
+          break
+        layer = layer._parent
+      else:
+        return default
+      if value is not _DELETED and self._copy is not None:
+        value = self._changes[key] = self._copy(value)
+    return default if value is _DELETED else value
+
+  def setdefault(self, key, default=None):
+    value = self._find(key)
+    if value is _DELETED:
+      value = self._changes[key] = default
+    return value
+
+  def __contains__(self, key):
+    layer = self
+    while layer is not None:
+      value = layer._changes.get(key, layer)
+      if value is not layer:
+        return value is not _DELETED
+      layer = layer._parent
+    return False
+
+  def __setitem__(self, key, value):
+    self._changes[key] = value
+
+  def __delitem__(self, key):
+    if not key in self:
+      raise KeyError(key)
+    if self._parent is None:
+      del self._changes[key]
+    else:
+      self._changes[key] = _DELETED
+
+  def __iter__(self):
+    return iter(self._merged())
+
+  def __len__(self):
+    return len(self._merged())
+
+  def items(self):
+    return self._merged().items()
+
+  def __repr__(self):
+    return repr(self._merged())
+
+
+class _OverlaySet(_Overlay):
+  """_Overlay used as a set of its keys"""
+
+  __slots__ = ()
+
+  def add(self, key):
+    self._changes[key] = True
+
+  def discard(self, key):
+    if self._parent is None:
+      self._changes.pop(key, None)
+    elif key in self:
+      self._changes[key] = _DELETED
+
+
+class PersistentBoard(Board):
+  """
+  Persistent representation of a Zombie Board.
+
+  A clone shares the tiles, the unplaced pieces and the indexes of the
+  board it is cloned from instead of copying them: each of them is an
+  _Overlay recording only the entries changed since the clone, on top
+  of layers frozen by the earlier clones and shared by all the boards
+  cloned from one another. The successors of a board then only hold
+  the few tiles changed by their action, at the price of lookups
+  through the layers, which are merged once there are more than
+  _OVERLAY_DEPTH of them.
+
+  The public API is the one of Board.
+
+  """
+
+  def __init__(self, percepts=None, backend=None):
+    """
+    Constructor of the persistent representation for a Zombies game.
+    The representation can be initialized by a percepts of any
+    backend, or by the bytes returned by to_bytes; it shares the
+    structure of a PersistentBoard. If
+    percepts==None:
+        The board is empty and each player has the starting
+        11 zombie pieces.
+    """
+    if isinstance(percepts, PersistentBoard):
+      self._tops = percepts._tops.fork()
+      self._buried = percepts._buried.fork()
+      self.unplaced_pieces = percepts.unplaced_pieces.fork()
+      self.side_to_move = percepts.side_to_move
+      self._locations = percepts._locations.fork()
+      self._degrees = percepts._degrees.fork()
+      self._touching = {}
+      self._placements = {}
+      for player in (PLAYER1, PLAYER2):
+        self._touching[player] = percepts._touching[player].fork()
+        self._placements[player] = percepts._placements[player].fork()
+      self.position_hash = percepts.position_hash
+      return
+    Board.__init__(self, percepts)
+    self._tops = _Overlay(self._tops)
+    self._buried = _Overlay(self._buried, list)
+    self.unplaced_pieces = _Overlay(self.unplaced_pieces)
+    self._locations = _Overlay(self._locations, set)
+    self._degrees = _Overlay(self._degrees)
+    for player in (PLAYER1, PLAYER2):
+      self._touching[player] = _Overlay(self._touching[player])
+      self._placements[player] = _OverlaySet(dict.fromkeys(self._placements[player], True))
+
+  def clone(self):
+    """Return a clone of this object, sharing its structure."""
+    return PersistentBoard(self)
+
+  def __getstate__(self):
+    # The indexes are overlays, pickled with the tiles
+    return self.__dict__
+
+
+# Available Board representations, selected by Board(backend=...)
+BACKENDS = {"dict": Board, "compact": CompactBoard,
+            "persistent": PersistentBoard}
+
 def load_percepts(csvfile):
   """Load percepts from a CSV file.
   """